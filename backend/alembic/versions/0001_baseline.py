@@ -7,7 +7,7 @@ Create Date: 2025-12-19
 from __future__ import annotations
 
 from alembic import op
-import sqlalchemy as sa
+from sqlalchemy.schema import CreateIndex, CreateTable
 
 revision = "0001_baseline"
 down_revision = None
@@ -15,16 +15,29 @@ branch_labels = None
 depends_on = None
 
 
+def _baseline_ddl(bind) -> list[str]:
+    # DDL compilado uma vez a partir do metadata (tabelas em ordem de FK + índices)
+    from app.infra.db.database import Base  # import local para evitar problemas de import no topo
+
+    tables = Base.metadata.sorted_tables
+    stmts = [str(CreateTable(t).compile(dialect=bind.dialect)).strip() for t in tables]
+    stmts += [str(CreateIndex(i).compile(dialect=bind.dialect)).strip() for t in tables for i in t.indexes]
+    return stmts
+
+
 def upgrade() -> None:
     # Baseline: criar todas as tabelas do metadata atual.
     # Isso evita autogenerate tentar ALTER COLUMN no SQLite.
+    # Roda dentro da transação do Alembic; o banco está vazio, então não há reflect/checkfirst.
     bind = op.get_bind()
-    meta = sa.MetaData()
-    meta.reflect(bind=bind)  # no-op em DB vazio
-    # O create_all abaixo NÃO cria a partir do meta refletido, então fazemos via import do Base:
-    from app.infra.db.database import Base  # import local para evitar problemas de import no topo
-
-    Base.metadata.create_all(bind=bind)
+    stmts = _baseline_ddl(bind)
+
+    if bind.dialect.name == "sqlite":
+        # sqlite3 não aceita vários statements num único execute
+        for stmt in stmts:
+            bind.exec_driver_sql(stmt)
+    else:
+        bind.exec_driver_sql(";\n".join(stmts) + ";")
 
 
 def downgrade() -> None:
@@ -0,0 +1,56 @@
+"""tryon_jobs api_key_id
+
+Revision ID: a8d4f2c6e9b1
+Revises: f7c3a9e1b2d6
+Create Date: 2026-10-15
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+
+# revision identifiers, used by Alembic.
+revision = "a8d4f2c6e9b1"
+down_revision = "f7c3a9e1b2d6"
+branch_labels = None
+depends_on = None
+
+
+_INDEX = "ix_tryon_jobs_api_key_id"
+
+
+def _has_column(table: str, column: str) -> bool:
+    # o baseline já cria a coluna em bancos novos (DDL vem do metadata atual)
+    cols = sa.inspect(op.get_bind()).get_columns(table)
+    return any(c["name"] == column for c in cols)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    if not _has_column("tryon_jobs", "api_key_id"):
+        op.add_column("tryon_jobs", sa.Column("api_key_id", UUID(as_uuid=True), nullable=True))
+
+    sql = f"CREATE INDEX {{}}IF NOT EXISTS {_INDEX} ON tryon_jobs (api_key_id)"
+    if bind.dialect.name == "postgresql":
+        # CONCURRENTLY não trava escrita na fila, mas não roda dentro de transação
+        with op.get_context().autocommit_block():
+            op.execute(sql.format("CONCURRENTLY "))
+    else:
+        op.execute(sql.format(""))
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {_INDEX}")
+    else:
+        op.execute(f"DROP INDEX IF EXISTS {_INDEX}")
+
+    with op.batch_alter_table("tryon_jobs") as batch_op:
+        batch_op.drop_column("api_key_id")
@@ -0,0 +1,60 @@
+"""tryon_jobs status indexes
+
+Revision ID: d1a7e3b9c0f4
+Revises: c3f96c4f2b52
+Create Date: 2026-10-15
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "d1a7e3b9c0f4"
+down_revision = "c3f96c4f2b52"
+branch_labels = None
+depends_on = None
+
+
+# (nome, colunas, where) — o baseline já cria estes índices em bancos novos,
+# por isso IF NOT EXISTS.
+_INDEXES = [
+    ("ix_tryon_status_created_at", "status, created_at", None),
+    ("ix_tryon_status_proc_started", "status, processing_started_at", None),
+    ("ix_tryon_queued_created_at", "created_at", "status = 'queued'"),
+]
+
+
+def _create_sql(name: str, cols: str, where: str | None, *, concurrently: bool) -> str:
+    sql = "CREATE INDEX {}IF NOT EXISTS {} ON tryon_jobs ({})".format(
+        "CONCURRENTLY " if concurrently else "", name, cols
+    )
+    if where:
+        sql += f" WHERE {where}"
+    return sql
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    if bind.dialect.name == "postgresql":
+        # CONCURRENTLY não trava escrita na fila, mas não roda dentro de transação
+        with op.get_context().autocommit_block():
+            for name, cols, where in _INDEXES:
+                op.execute(_create_sql(name, cols, where, concurrently=True))
+    else:
+        for name, cols, where in _INDEXES:
+            op.execute(_create_sql(name, cols, where, concurrently=False))
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for name, _, _ in _INDEXES:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    else:
+        for name, _, _ in _INDEXES:
+            op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,34 @@
+"""tryon_jobs result_mime_type
+
+Revision ID: e4b2c8d5a1f7
+Revises: d1a7e3b9c0f4
+Create Date: 2026-10-15
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e4b2c8d5a1f7"
+down_revision = "d1a7e3b9c0f4"
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    # o baseline já cria a coluna em bancos novos (DDL vem do metadata atual)
+    cols = sa.inspect(op.get_bind()).get_columns(table)
+    return any(c["name"] == column for c in cols)
+
+
+def upgrade() -> None:
+    if not _has_column("tryon_jobs", "result_mime_type"):
+        op.add_column("tryon_jobs", sa.Column("result_mime_type", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("tryon_jobs") as batch_op:
+        batch_op.drop_column("result_mime_type")
@@ -0,0 +1,57 @@
+"""api_keys key_hash
+
+Revision ID: f7c3a9e1b2d6
+Revises: e4b2c8d5a1f7
+Create Date: 2026-10-15
+
+"""
+from __future__ import annotations
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f7c3a9e1b2d6"
+down_revision = "e4b2c8d5a1f7"
+branch_labels = None
+depends_on = None
+
+
+def _hash_key(key: str) -> bytes:
+    # mesmo digest de ApiKey.hash_key (copiado: migração não depende do model)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+
+    # o baseline já cria key_hash em bancos novos (DDL vem do metadata atual)
+    if any(c["name"] == "key_hash" for c in insp.get_columns("api_keys")):
+        return
+
+    op.add_column("api_keys", sa.Column("key_hash", sa.LargeBinary(16), nullable=True))
+
+    api_keys = sa.table("api_keys", sa.column("id"), sa.column("key", sa.String), sa.column("key_hash", sa.LargeBinary))
+    rows = bind.execute(sa.select(api_keys.c.id, api_keys.c.key)).all()
+    if rows:
+        bind.execute(
+            api_keys.update().where(api_keys.c.id == sa.bindparam("_id")).values(key_hash=sa.bindparam("_hash")),
+            [{"_id": r.id, "_hash": _hash_key(r.key)} for r in rows],
+        )
+
+    with op.batch_alter_table("api_keys") as batch_op:
+        batch_op.alter_column("key_hash", existing_type=sa.LargeBinary(16), nullable=False)
+        batch_op.create_index("ix_api_keys_key_hash", ["key_hash"], unique=True)
+        # lookup passa a ser pelo digest; índice na string da chave não é mais usado
+        batch_op.drop_index("ix_api_keys_key")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("api_keys") as batch_op:
+        batch_op.create_index("ix_api_keys_key", ["key"], unique=True)
+        batch_op.drop_index("ix_api_keys_key_hash")
+        batch_op.drop_column("key_hash")
@@ -1,44 +1,138 @@
 from __future__ import annotations
-from typing import Any, Dict, List
+import hashlib
+import os
+from typing import Any, Dict, List, Optional
 import numpy as np
 import cv2
 
+from settings import CUTOUTS_DIR, CV_NUM_THREADS, GARMENT_CUTOUT_CACHE_MAX, WORKER_PROCESSES
+
+def configure_worker_threads() -> int:
+    """
+    Limita o pool de threads do OpenCV no processo de worker: com
+    WORKER_PROCESSES processos cada um usando todos os núcleos, resize/blend
+    disputam CPU entre si. Chamar no início do processo, antes do primeiro job.
+    """
+    n = CV_NUM_THREADS or max(1, (os.cpu_count() or 1) // max(1, WORKER_PROCESSES))
+    cv2.setNumThreads(n)
+    return n
+
+
+# Limites HSV do fundo branco no recorte (V >= 235, S <= 40); H cobre 0..180
+_WHITE_BG_LOWER = np.array([0, 0, 235], np.uint8)
+_WHITE_BG_UPPER = np.array([180, 40, 255], np.uint8)
+
+# Elementos estruturantes elípticos por tamanho (evita recriar a cada chamada)
+_ELLIPSE_KERNELS: Dict[int, np.ndarray] = {}
+
+
+def _ellipse_kernel(k: int) -> np.ndarray:
+    k |= 1
+    kernel = _ELLIPSE_KERNELS.get(k)
+    if kernel is None:
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+        _ELLIPSE_KERNELS[k] = kernel
+    return kernel
+
+
+# Raio a partir do qual a morfologia usa a cruz 3x3 iterada no lugar da elipse
+CROSS_MORPH_MIN_RADIUS = 4
+_CROSS_3X3 = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+
+
+def _close_open(mask: np.ndarray, k: int) -> np.ndarray:
+    """
+    Fechamento seguido de abertura com raio k // 2.
+    Raios pequenos usam a elipse k x k. A partir de CROSS_MORPH_MIN_RADIUS, usa
+    a cruz 3x3 iterada r vezes (caminho rápido do OpenCV para kernel pequeno,
+    ~3x mais rápido em 2K): o elemento efetivo vira um losango em vez de um
+    círculo, diferença que só aparece nos cantos e some no blur seguinte.
+    """
+    r = (k | 1) // 2
+    if r < CROSS_MORPH_MIN_RADIUS:
+        kernel = _ellipse_kernel(k)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=1)
+        return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, _CROSS_3X3, iterations=r)
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, _CROSS_3X3, iterations=r)
+
+
+# Peça no worker: acima deste tamanho de arquivo decodifica já reduzida pela
+# metade (DCT scaling do libjpeg). Ela é redimensionada para o anchor de
+# qualquer forma, então a resolução cheia só custaria memória/banda.
+GARMENT_REDUCED_DECODE_MIN_BYTES = 2 * 1024 * 1024
+
+
+def _garment_flags_for_size(size: int) -> int:
+    return cv2.IMREAD_REDUCED_COLOR_2 if size > GARMENT_REDUCED_DECODE_MIN_BYTES else cv2.IMREAD_COLOR
+
+
+def garment_imread_flags(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        # deixa o imread reportar o erro
+        return cv2.IMREAD_COLOR
+    return _garment_flags_for_size(size)
+
 
 def decode_upload_to_bgr(upload_file) -> np.ndarray:
     raw = upload_file.file.read()
-    arr = np.frombuffer(raw, dtype=np.uint8)
-    bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    bgr = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_COLOR)
+    del raw  # libera o buffer do upload antes de seguir com a imagem
     if bgr is None:
         raise ValueError("Falha ao decodificar imagem.")
     return bgr
 
 
+# zlib nível 1: PNG um pouco maior, encode bem mais rápido
+PNG_ENCODE_PARAMS = [int(cv2.IMWRITE_PNG_COMPRESSION), 1]
+
+
 def encode_png_rgba(bgra: np.ndarray) -> bytes:
-    rgba = cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGBA)
-    ok, buf = cv2.imencode(".png", rgba)
+    # O encoder PNG do OpenCV já recebe BGRA e grava RGBA no arquivo
+    ok, buf = cv2.imencode(".png", bgra, PNG_ENCODE_PARAMS)
     if not ok:
         raise RuntimeError("Falha ao codificar PNG.")
     return buf.tobytes()
 
 
 def _laplacian_variance(gray: np.ndarray) -> float:
-    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    # Laplaciano 3x3 de uint8 cabe em int16; meanStdDev faz a variância numa passada (acumula em double)
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    return float(std[0, 0]) ** 2
 
 
-def _estimate_white_bg_ratio(bgr: np.ndarray, thr: int = 235) -> float:
-    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
-    v = hsv[:, :, 2]
-    s = hsv[:, :, 1]
-    mask = (v >= thr) & (s <= 35)
-    return float(np.mean(mask))
+def _estimate_white_bg_ratio_from_hsv(hsv: np.ndarray, thr: int = 235) -> float:
+    # V >= thr e S <= 35 numa passada só (inRange), sem as 3 máscaras bool H×W
+    mask = cv2.inRange(hsv, (0, 0, thr), (180, 35, 255))
+    return cv2.countNonZero(mask) / mask.size
 
 
 def _edge_density(gray: np.ndarray) -> float:
     edges = cv2.Canny(gray, 80, 180)
-    return float(np.mean(edges > 0))
+    return np.count_nonzero(edges) / edges.size
+
+
+# Fundo branco (proporção, ~invariante à escala) sai de uma miniatura (lado
+# maior <= 512px). Nitidez e densidade de bordas NÃO: reduzir a
+# imagem a deixa mais "nítida" e os limiares abaixo são da resolução cheia.
+VALIDATION_MAX_SIDE = 512
+
+
+def _thumbnail(bgr: np.ndarray, max_side: int) -> np.ndarray:
+    h, w = bgr.shape[:2]
+    scale = max_side / float(max(h, w))
+    if scale >= 1.0:
+        return bgr
+    return cv2.resize(bgr, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
 
 
 def validate_garment_photo(bgr: np.ndarray) -> Dict[str, Any]:
+    """
+    Espera a imagem na resolução original: os limiares de nitidez e bordas
+    não valem para uma versão reduzida (decode reduzido ou miniatura).
+    """
     h, w = bgr.shape[:2]
     reasons: List[str] = []
     tips: List[str] = []
@@ -48,18 +142,19 @@ def validate_garment_photo(bgr: np.ndarray) -> Dict[str, Any]:
         tips.append("Aproxime a peça e use maior resolução.")
 
     gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+    hsv = cv2.cvtColor(_thumbnail(bgr, VALIDATION_MAX_SIDE), cv2.COLOR_BGR2HSV)
 
     sharpness = _laplacian_variance(gray)
     if sharpness < 70:
         reasons.append("TOO_BLURRY")
         tips.append("Imagem desfocada. Apoie o celular e aumente a luz.")
 
-    brightness = float(np.mean(gray))
+    brightness = float(cv2.mean(gray)[0])
     if brightness < 70:
         reasons.append("LOW_LIGHT")
         tips.append("Pouca luz. Faça a foto em ambiente mais iluminado.")
 
-    white_ratio = _estimate_white_bg_ratio(bgr, thr=235)
+    white_ratio = _estimate_white_bg_ratio_from_hsv(hsv, thr=235)
     if white_ratio < 0.25:
         reasons.append("BUSY_BACKGROUND")
         tips.append("Fundo poluído. Prefira fundo liso e com contraste.")
@@ -94,60 +189,81 @@ def validate_garment_photo(bgr: np.ndarray) -> Dict[str, Any]:
     }
 
 
-def _decontaminate_border(bgra: np.ndarray) -> np.ndarray:
-    b = bgra[:, :, 0].astype(np.float32)
-    g = bgra[:, :, 1].astype(np.float32)
-    r = bgra[:, :, 2].astype(np.float32)
-    a = bgra[:, :, 3].astype(np.float32) / 255.0
-
+def _build_decontaminate_lut() -> np.ndarray:
+    # LUT[alpha, canal] -> canal escurecido; o fator só depende do alpha (256 valores)
+    a = np.arange(256, dtype=np.float32) / 255.0
     edge = (a > 0.02) & (a < 0.85)
-    strength = np.zeros_like(a, dtype=np.float32)
+    strength = np.zeros_like(a)
     strength[edge] = (0.85 - a[edge]) / 0.83
-
     factor = 1.0 - 0.35 * strength
-    b = b * factor
-    g = g * factor
-    r = r * factor
-
-    out = bgra.copy()
-    out[:, :, 0] = np.clip(b, 0, 255).astype(np.uint8)
-    out[:, :, 1] = np.clip(g, 0, 255).astype(np.uint8)
-    out[:, :, 2] = np.clip(r, 0, 255).astype(np.uint8)
-    return out
 
+    c = np.arange(256, dtype=np.float32)
+    return np.clip(factor[:, None] * c[None, :], 0, 255).astype(np.uint8)
 
-def _remove_white_background_to_bgra(bgr: np.ndarray) -> np.ndarray:
-    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
-    s = hsv[:, :, 1]
-    v = hsv[:, :, 2]
 
-    bg = (v >= 235) & (s <= 40)
-    alpha = (~bg).astype(np.uint8) * 255
-    alpha = cv2.GaussianBlur(alpha, (0, 0), sigmaX=1.2, sigmaY=1.2)
-    alpha = np.clip(alpha, 0, 255).astype(np.uint8)
+_DECONTAMINATE_LUT = _build_decontaminate_lut()
+# faixa de alpha (inclusiva) em que o fator < 1; fora dela o pixel não muda
+_EDGE_ALPHAS = np.nonzero(_DECONTAMINATE_LUT[:, 255] < 255)[0]
+_EDGE_ALPHA_LO = int(_EDGE_ALPHAS[0])
+_EDGE_ALPHA_HI = int(_EDGE_ALPHAS[-1])
+
+
+def _decontaminate_border(bgra: np.ndarray) -> np.ndarray:
+    """
+    Escurece levemente a borda semi-transparente (remove halo do fundo).
+    Só visita os pixels de borda (via LUT 256x256); altera `bgra` in-place.
+    """
+    edge = cv2.inRange(bgra[:, :, 3], _EDGE_ALPHA_LO, _EDGE_ALPHA_HI)
+    ys, xs = np.nonzero(edge)
+    if ys.size == 0:
+        return bgra
+
+    px = bgra[ys, xs]
+    px[:, :3] = _DECONTAMINATE_LUT[px[:, 3:4], px[:, :3]]
+    bgra[ys, xs] = px
+    return bgra
+
+
+def _remove_white_background_to_bgra(bgr: np.ndarray, hsv: Optional[np.ndarray] = None) -> np.ndarray:
+    if hsv is None:
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+
+    # fundo = V >= 235 e S <= 40; inRange + not (SIMD) em vez de 3 máscaras bool
+    alpha = cv2.inRange(hsv, _WHITE_BG_LOWER, _WHITE_BG_UPPER)
+    cv2.bitwise_not(alpha, dst=alpha)
+    # feather de ~1px: box 3x3 basta (Gaussian sigma 1.2 seria kernel 9x9); saída já é uint8
+    alpha = cv2.boxFilter(alpha, -1, (3, 3), borderType=cv2.BORDER_REPLICATE, dst=alpha)
 
     bgra = cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA)
     bgra[:, :, 3] = alpha
     return _decontaminate_border(bgra)
 
 
+# GrabCut roda numa versão reduzida (lado maior <= 512px); a máscara volta
+# para a resolução original antes da limpeza morfológica.
+GRABCUT_MAX_SIDE = 512
+
+
 def _grabcut_cutout_to_bgra(bgr: np.ndarray) -> np.ndarray:
     h, w = bgr.shape[:2]
-    margin_x = int(w * 0.08)
-    margin_y = int(h * 0.08)
-    rect = (margin_x, margin_y, w - 2 * margin_x, h - 2 * margin_y)
+    small = _thumbnail(bgr, GRABCUT_MAX_SIDE)
+    sh, sw = small.shape[:2]
 
-    mask = np.zeros((h, w), np.uint8)
+    margin_x = int(sw * 0.08)
+    margin_y = int(sh * 0.08)
+    rect = (margin_x, margin_y, sw - 2 * margin_x, sh - 2 * margin_y)
+
+    mask = np.zeros((sh, sw), np.uint8)
     bgdModel = np.zeros((1, 65), np.float64)
     fgdModel = np.zeros((1, 65), np.float64)
 
-    cv2.grabCut(bgr, mask, rect, bgdModel, fgdModel, 5, cv2.GC_INIT_WITH_RECT)
+    cv2.grabCut(small, mask, rect, bgdModel, fgdModel, 5, cv2.GC_INIT_WITH_RECT)
     fg = np.where((mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD), 255, 0).astype("uint8")
+    if (sh, sw) != (h, w):
+        fg = cv2.resize(fg, (w, h), interpolation=cv2.INTER_LINEAR)
 
     k = max(3, int(min(h, w) * 0.01) | 1)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
-    fg = cv2.morphologyEx(fg, cv2.MORPH_CLOSE, kernel, iterations=1)
-    fg = cv2.morphologyEx(fg, cv2.MORPH_OPEN, kernel, iterations=1)
+    fg = _close_open(fg, k)
 
     fg = cv2.GaussianBlur(fg, (0, 0), sigmaX=2.0, sigmaY=2.0)
     fg = np.clip(fg, 0, 255).astype(np.uint8)
@@ -158,15 +274,153 @@ def _grabcut_cutout_to_bgra(bgr: np.ndarray) -> np.ndarray:
 
 
 def garment_cutout_auto_bgra(bgr: np.ndarray) -> np.ndarray:
-    white_ratio = _estimate_white_bg_ratio(bgr, thr=232)
+    # HSV calculado uma vez: serve para a decisão e para o recorte de fundo branco
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    white_ratio = _estimate_white_bg_ratio_from_hsv(hsv, thr=232)
     if white_ratio >= 0.55:
-        return _remove_white_background_to_bgra(bgr)
+        return _remove_white_background_to_bgra(bgr, hsv=hsv)
     return _grabcut_cutout_to_bgra(bgr)
 
 
-def overlay_bgra_on_bgr(base_bgr: np.ndarray, fg_bgra: np.ndarray, x: int, y: int) -> np.ndarray:
-    out = base_bgr.copy()
-    bh, bw = out.shape[:2]
+# Sobe quando o recorte muda: entradas antigas deixam de casar pela chave
+_CUTOUT_CACHE_VERSION = b"2"
+_CUTOUTS = str(CUTOUTS_DIR)
+
+
+def _prune_cutout_cache() -> None:
+    # LRU pelo mtime (tocado a cada hit); roda só quando uma entrada é criada
+    try:
+        entries = [e for e in os.scandir(_CUTOUTS) if e.name.endswith(".npy")]
+    except OSError:
+        return
+    excess = len(entries) - GARMENT_CUTOUT_CACHE_MAX
+    if excess <= 0:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for e in entries[:excess]:
+        try:
+            os.remove(e.path)
+        except OSError:
+            pass
+
+
+def load_garment_cutout_bgra(path: str) -> np.ndarray:
+    """
+    Lê a peça e devolve o recorte BGRA pré-multiplicado (premultiply_bgra), com
+    cache em disco por conteúdo do arquivo: a mesma peça provada em várias
+    pessoas pula decode + recorte (GrabCut no pior caso). Entradas são .npy
+    gravados de forma atômica.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    cache_path = None
+    if GARMENT_CUTOUT_CACHE_MAX > 0:
+        digest = hashlib.blake2b(raw, digest_size=20)
+        digest.update(_CUTOUT_CACHE_VERSION)
+        cache_path = f"{_CUTOUTS}/{digest.hexdigest()}.npy"
+        try:
+            bgra = np.load(cache_path, allow_pickle=False)
+        except (OSError, ValueError):
+            bgra = None
+        if bgra is not None:
+            try:
+                os.utime(cache_path)
+            except OSError:
+                pass
+            return bgra
+
+    bgr = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), _garment_flags_for_size(len(raw)))
+    del raw
+    if bgr is None:
+        raise ValueError(f"Failed to read image: {path}")
+    bgra = premultiply_bgra(garment_cutout_auto_bgra(bgr))
+
+    if cache_path is not None:
+        # tmp por processo + rename: outro worker nunca lê um .npy pela metade
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, bgra, allow_pickle=False)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        else:
+            _prune_cutout_cache()
+    return bgra
+
+
+# Abaixo desta escala o INTER_AREA compensa (evita aliasing); acima, o
+# INTER_LINEAR dá o mesmo resultado visual ~5x mais rápido.
+AREA_RESIZE_MAX_SCALE = 0.5
+
+
+def resize_garment(garment_bgra: np.ndarray, w: int, h: int) -> np.ndarray:
+    """Redimensiona a peça para o anchor escolhendo a interpolação pela escala."""
+    src_h, src_w = garment_bgra.shape[:2]
+    scale = min(w / src_w, h / src_h)
+    interp = cv2.INTER_AREA if scale < AREA_RESIZE_MAX_SCALE else cv2.INTER_LINEAR
+    return cv2.resize(garment_bgra, (w, h), interpolation=interp)
+
+
+def premultiply_bgra(bgra: np.ndarray) -> np.ndarray:
+    """
+    Multiplica a cor pelo alpha (in-place). O overlay de uma peça
+    pré-multiplicada vira fg + bg*(1-a), e o resize já não puxa a cor do
+    fundo removido para a borda.
+    """
+    a = bgra[:, :, 3]
+    bgra[:, :, :3] = cv2.multiply(
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR), cv2.merge((a, a, a)), scale=1.0 / 255.0
+    )
+    return bgra
+
+
+def _blend_premultiplied_into(bg: np.ndarray, fg_bgra: np.ndarray) -> np.ndarray:
+    """
+    bg = fg + bg*(1-a) para fg pré-multiplicado: só aritmética uint8 saturada,
+    ~2.5x mais rápido que o blendLinear (sem pesos float). Escreve em `bg`.
+    """
+    inv = cv2.bitwise_not(fg_bgra[:, :, 3])
+    fg_bgr = cv2.cvtColor(fg_bgra, cv2.COLOR_BGRA2BGR)
+    bg[...] = cv2.add(cv2.multiply(bg, cv2.merge((inv, inv, inv)), scale=1.0 / 255.0), fg_bgr)
+    return bg
+
+
+def _blend_bgra_into(bg: np.ndarray, fg_bgra: np.ndarray) -> np.ndarray:
+    """
+    Alpha blend bg = fg*a + bg*(1-a) em uint8: dois multiply saturados e um add,
+    sem mapas de peso float32 (difere do blend inteiro exato em no máximo 1 nível).
+    Escreve o resultado em `bg` (in-place) e o retorna.
+    """
+    a = fg_bgra[:, :, 3]
+    inv = cv2.bitwise_not(a)
+    fg_bgr = cv2.cvtColor(fg_bgra, cv2.COLOR_BGRA2BGR)
+    bg[...] = cv2.add(
+        cv2.multiply(fg_bgr, cv2.merge((a, a, a)), scale=1.0 / 255.0),
+        cv2.multiply(bg, cv2.merge((inv, inv, inv)), scale=1.0 / 255.0),
+    )
+    return bg
+
+
+def overlay_bgra_on_bgr(
+    base_bgr: np.ndarray,
+    fg_bgra: np.ndarray,
+    x: int,
+    y: int,
+    *,
+    inplace: bool = False,
+    premultiplied: bool = False,
+) -> np.ndarray:
+    """
+    Compõe fg_bgra sobre base_bgr na posição (x, y).
+    premultiplied=True quando fg_bgra veio de premultiply_bgra (ex.: load_garment_cutout_bgra).
+    Sem interseção, devolve o próprio base_bgr (sem cópia): trate o retorno como imutável.
+    """
+    bh, bw = base_bgr.shape[:2]
     fh, fw = fg_bgra.shape[:2]
 
     x1 = max(0, x)
@@ -174,15 +428,12 @@ def overlay_bgra_on_bgr(base_bgr: np.ndarray, fg_bgra: np.ndarray, x: int, y: in
     x2 = min(bw, x + fw)
     y2 = min(bh, y + fh)
     if x1 >= x2 or y1 >= y2:
-        return out
+        return base_bgr
 
-    roi = out[y1:y2, x1:x2]
+    out = base_bgr if inplace else base_bgr.copy()
     fg_roi = fg_bgra[(y1 - y):(y2 - y), (x1 - x):(x2 - x)]
-
-    alpha = (fg_roi[:, :, 3:4].astype(np.float32) / 255.0)
-    fg_rgb = fg_roi[:, :, :3].astype(np.float32)
-    bg_rgb = roi.astype(np.float32)
-
-    comp = fg_rgb * alpha + bg_rgb * (1.0 - alpha)
-    out[y1:y2, x1:x2] = np.clip(comp, 0, 255).astype(np.uint8)
+    if premultiplied:
+        _blend_premultiplied_into(out[y1:y2, x1:x2], fg_roi)
+    else:
+        _blend_bgra_into(out[y1:y2, x1:x2], fg_roi)
     return out
@@ -1,9 +1,40 @@
 from __future__ import annotations
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import cv2
 import mediapipe as mp
+import numpy as np
+
+from settings import POSE_MODEL_COMPLEXITY
+
+# Lado maior da imagem enviada ao Pose; landmarks são normalizados, então
+# não é preciso reescalar de volta (basta multiplicar pelo w/h original).
+POSE_INPUT_SIDE = 256
+
+# Índices dos landmarks resolvidos uma vez (evita a cadeia mp.solutions... por chamada)
+_LEFT_SHOULDER = int(mp.solutions.pose.PoseLandmark.LEFT_SHOULDER)
+_RIGHT_SHOULDER = int(mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER)
+
+# Cache do resultado do Pose por conteúdo da imagem (retry do mesmo job, a
+# mesma pessoa com outra peça): o modelo é determinístico para a mesma entrada.
+# Chave = blake2b da imagem já reduzida (barato de hashear); valor = ombros
+# normalizados, ou None quando nada foi detectado.
+POSE_CACHE_SIZE = 256
+
+# (lx, ly, l_visibility, rx, ry, r_visibility), coordenadas normalizadas
+Shoulders = Tuple[float, float, float, float, float, float]
+
+_pose_cache: "OrderedDict[bytes, Optional[Shoulders]]" = OrderedDict()
+_pose_cache_lock = threading.Lock()
+
+_pose_local = threading.local()
+_pose_instances: List["mp.solutions.pose.Pose"] = []
+_pose_instances_lock = threading.Lock()
 
 
 @dataclass
@@ -14,34 +45,89 @@ class TorsoAnchor:
     h: int
 
 
-def detect_torso_anchor_mediapipe(person_bgr, width_ratio: float = 0.62, height_ratio: float = 0.55) -> Optional[TorsoAnchor]:
-    h, w = person_bgr.shape[:2]
-    rgb = cv2.cvtColor(person_bgr, cv2.COLOR_BGR2RGB)
-
-    pose = mp.solutions.pose.Pose(
-        static_image_mode=True,
-        model_complexity=1,
-        enable_segmentation=False,
-        min_detection_confidence=0.5,
-    )
-
-    res = pose.process(rgb)
-    pose.close()
-
+def get_pose_detector() -> "mp.solutions.pose.Pose":
+    """
+    Factory única do detector de pose: um Pose por thread (o grafo do MediaPipe
+    não é thread-safe), criado uma vez e reutilizado.
+    A API mp.solutions roda no delegate XNNPACK (CPU); em hosts só com CPU,
+    POSE_MODEL_COMPLEXITY=0 usa o modelo lite.
+    """
+    pose = getattr(_pose_local, "pose", None)
+    if pose is None:
+        pose = mp.solutions.pose.Pose(
+            static_image_mode=True,
+            model_complexity=POSE_MODEL_COMPLEXITY,
+            enable_segmentation=False,
+            min_detection_confidence=0.5,
+        )
+        _pose_local.pose = pose
+        with _pose_instances_lock:
+            _pose_instances.append(pose)
+    return pose
+
+
+@atexit.register
+def _close_poses() -> None:
+    with _pose_instances_lock:
+        while _pose_instances:
+            _pose_instances.pop().close()
+
+
+def _downscale_for_pose(bgr):
+    h, w = bgr.shape[:2]
+    scale = POSE_INPUT_SIDE / float(max(h, w))
+    if scale >= 1.0:
+        return bgr
+    return cv2.resize(bgr, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def _run_pose(small_bgr) -> Optional[Shoulders]:
+    rgb = cv2.cvtColor(small_bgr, cv2.COLOR_BGR2RGB)
+    res = get_pose_detector().process(rgb)
     if not res.pose_landmarks:
         return None
 
     lm = res.pose_landmarks.landmark
+    l_sh = lm[_LEFT_SHOULDER]
+    r_sh = lm[_RIGHT_SHOULDER]
+    return (l_sh.x, l_sh.y, l_sh.visibility, r_sh.x, r_sh.y, r_sh.visibility)
+
+
+def detect_shoulders(person_bgr) -> Optional[Shoulders]:
+    """Ombros normalizados (0..1) do Pose, com cache por conteúdo da imagem."""
+    small = np.ascontiguousarray(_downscale_for_pose(person_bgr))
+    digest = hashlib.blake2b(small, digest_size=16)
+    digest.update(repr(small.shape).encode("ascii"))
+    key = digest.digest()
+
+    with _pose_cache_lock:
+        if key in _pose_cache:
+            _pose_cache.move_to_end(key)
+            return _pose_cache[key]
+
+    shoulders = _run_pose(small)
+
+    with _pose_cache_lock:
+        _pose_cache[key] = shoulders
+        _pose_cache.move_to_end(key)
+        while len(_pose_cache) > POSE_CACHE_SIZE:
+            _pose_cache.popitem(last=False)
+    return shoulders
 
-    # ombros
-    l_sh = lm[mp.solutions.pose.PoseLandmark.LEFT_SHOULDER]
-    r_sh = lm[mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER]
 
-    if (l_sh.visibility < 0.4) or (r_sh.visibility < 0.4):
+def detect_torso_anchor_mediapipe(person_bgr, width_ratio: float = 0.62, height_ratio: float = 0.55) -> Optional[TorsoAnchor]:
+    h, w = person_bgr.shape[:2]
+
+    shoulders = detect_shoulders(person_bgr)
+    if shoulders is None:
+        return None
+
+    l_x, l_y, l_vis, r_x, r_y, r_vis = shoulders
+    if (l_vis < 0.4) or (r_vis < 0.4):
         return None
 
-    lx, ly = int(l_sh.x * w), int(l_sh.y * h)
-    rx, ry = int(r_sh.x * w), int(r_sh.y * h)
+    lx, ly = int(l_x * w), int(l_y * h)
+    rx, ry = int(r_x * w), int(r_y * h)
 
     shoulder_w = max(1, abs(rx - lx))
     cx = (lx + rx) // 2
@@ -3,14 +3,23 @@ from __future__ import annotations
 
 from fastapi import Depends
 
-from app.infra.db.models import ApiKey
+from app.security.api_key_cache import ApiKeyView
 from app.security.auth import require_api_key
-from app.security.rate_limiter import SimpleRateLimiter
+from app.security.rate_limiter import ShardedRateLimiter
+from settings import REDIS_URL
 
-limiter = SimpleRateLimiter()
+# Com Redis o limite vale para todos os processos; sem, fica por processo
+if REDIS_URL:
+    from app.infra.queue.redis_pool import get_redis
+    from app.security.redis_rate_limiter import RedisRateLimiter
 
+    limiter = RedisRateLimiter(get_redis())
+else:
+    limiter = ShardedRateLimiter()
 
-def rate_limit(api_key: ApiKey = Depends(require_api_key)) -> ApiKey:
+
+def rate_limit(api_key: ApiKeyView = Depends(require_api_key)) -> ApiKeyView:
     rpm = int(api_key.rpm_limit or 60)
-    limiter.check(api_key.key, rpm)
+    # id, não a chave em texto: o nome do bucket vai parar no Redis
+    limiter.check(str(api_key.id), rpm)
     return api_key
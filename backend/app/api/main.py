@@ -3,13 +3,36 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
 from settings import API_TITLE, API_VERSION, STORAGE_DIR
+from app.infra.db.database import begin_request_scope, end_request_scope
 from app.api.routes.tryon import router as tryon_router
 from app.api.routes.garment import router as garment_router
 from app.api.routes.admin import router as admin_router
 
 
+class DBSessionScopeMiddleware:
+    """
+    Middleware ASGI: um escopo de ScopedSession por request, removido quando a
+    resposta termina (inclusive em streaming/FileResponse).
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = begin_request_scope()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            end_request_scope(token)
+
+
 def create_app() -> FastAPI:
     app = FastAPI(title=API_TITLE, version=API_VERSION)
+    app.add_middleware(DBSessionScopeMiddleware)
 
     # Serve arquivos gerados/armazenados
     app.mount("/storage", StaticFiles(directory=str(STORAGE_DIR)), name="storage")
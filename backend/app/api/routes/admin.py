@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
 from app.api.deps import rate_limit
-from app.infra.db.database import get_db
+from app.infra.db.database import engine, get_db
 from app.infra.db.crud import list_jobs
+from app.security.api_key_cache import ApiKeyView
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -12,7 +13,7 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 def admin_list_jobs(
     status: str | None = None,
     limit: int = 50,
-    _api_key: str = Depends(rate_limit),
+    _api_key: ApiKeyView = Depends(rate_limit),
     db: Session = Depends(get_db),
 ):
     items = list_jobs(db, status=status, limit=min(max(limit, 1), 200))
@@ -23,3 +24,9 @@ def admin_list_jobs(
         "created_at": j.created_at.isoformat(),
         "updated_at": j.updated_at.isoformat(),
     } for j in items]
+
+
+@router.get("/pool")
+def admin_pool_status(_api_key: ApiKeyView = Depends(rate_limit)):
+    # útil para calibrar DB_POOL_SIZE / DB_MAX_OVERFLOW; autenticado como /admin/jobs
+    return {"ok": True, "pool": engine.pool.status()}
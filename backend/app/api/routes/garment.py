@@ -3,7 +3,12 @@ from sqlalchemy.orm import Session
 
 from app.api.deps import rate_limit
 from app.infra.db.database import get_db
-from app.ai.image_utils import decode_upload_to_bgr, validate_garment_photo, garment_cutout_auto_bgra, encode_png_rgba
+from app.ai.image_utils import (
+    decode_upload_to_bgr,
+    encode_png_rgba,
+    garment_cutout_auto_bgra,
+    validate_garment_photo,
+)
 
 router = APIRouter(prefix="/garment", tags=["garment"])
 
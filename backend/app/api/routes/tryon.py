@@ -1,33 +1,175 @@
 # backend/app/api/routes/tryon.py
 from __future__ import annotations
 
-from pathlib import Path
+import asyncio
+import io
+import os
+import sys
 from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 
 from app.api.deps import rate_limit
 from app.infra.db.crud import create_job, get_job
 from app.infra.db.database import get_db
-from app.infra.db.models import ApiKey
-from settings import UPLOADS_DIR
+from app.security.api_key_cache import ApiKeyView
+from settings import RESULTS_ACCEL_REDIRECT_PREFIX, UPLOADS_DIR
 
 
 router = APIRouter(prefix="/tryon", tags=["tryon"])
 
 # Hardening básico para uploads no MVP
 MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # 1MB
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+ALLOWED_IMAGE_TYPES = frozenset({"image/jpeg", "image/png", "image/webp"})
+_HAS_SENDFILE = sys.platform == "linux" and hasattr(os, "sendfile")
+# Acima disso o Starlette já despejou o upload em disco (spool_max_size do
+# MultiPartParser)
+_SPOOL_MAX_BYTES = 1024 * 1024
 
+# Assinaturas dos formatos aceitos (o content_type é só o que o cliente declarou)
+_SNIFF_BYTES = 12
 
-def _ensure_dir(path: Path) -> None:
-    path.mkdir(parents=True, exist_ok=True)
 
+def _looks_like_image(head: bytes) -> bool:
+    return (
+        head.startswith(b"\xff\xd8\xff")
+        or head.startswith(b"\x89PNG\r\n\x1a\n")
+        or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+    )
 
-def _read_upload_or_413(upload: UploadFile, max_bytes: int) -> bytes:
-    data = upload.file.read(max_bytes + 1)
-    if len(data) > max_bytes:
+
+# Resultado é imutável (nome = UUID do job): pode ficar em cache de cliente/CDN
+RESULT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Aceita lista e validador fraco (W/"...")
+    tags = (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+    return etag in tags
+
+
+# UPLOADS_DIR é criado no import do settings: nada de mkdir por request.
+# Caminhos montados como str (sem objetos Path por upload).
+_UPLOADS = str(UPLOADS_DIR)
+_OPEN_WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_CLOEXEC", 0)
+
+
+def _remove_files(*paths: str) -> None:
+    for p in paths:
+        try:
+            os.unlink(p)
+        except FileNotFoundError:
+            pass
+
+
+def _open_for_write(path: str):
+    return open(os.open(path, _OPEN_WRITE_FLAGS, 0o644), "wb", buffering=0)
+
+
+def _copy_with_buffer(src, path: str, max_bytes: int) -> int:
+    buf = bytearray(UPLOAD_CHUNK_BYTES)
+    view = memoryview(buf)
+    written = 0
+    with _open_for_write(path) as f:
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            written += n
+            if written > max_bytes:
+                break
+            f.write(view[:n])
+    return written
+
+
+def _copy_with_sendfile(src, path: str, max_bytes: int) -> int:
+    """
+    Upload já despejado em arquivo temporário: o tamanho vem do fstat (rejeita
+    antes de escrever) e a cópia é feita pelo kernel com sendfile(2).
+    """
+    fd = src.fileno()
+    offset = src.tell()
+    size = os.fstat(fd).st_size - offset
+    if size > max_bytes or size <= 0:
+        return max(size, 0)
+
+    with _open_for_write(path) as f:
+        out_fd = f.fileno()
+        remaining = size
+        while remaining > 0:
+            sent = os.sendfile(out_fd, fd, offset, remaining)
+            if sent == 0:
+                break
+            offset += sent
+            remaining -= sent
+    return size - remaining
+
+
+def _upload_on_disk(upload: UploadFile) -> bool:
+    """
+    True se o upload já tem arquivo real por trás (dá para usar sendfile).
+    Só pergunta o fileno() a uploads maiores que o spool: nos menores ele
+    forçaria o rollover, copiando para disco só para ler de volta.
+    """
+    if not _HAS_SENDFILE or upload.size is None or upload.size <= _SPOOL_MAX_BYTES:
+        return False
+    try:
+        upload.file.fileno()
+    except (io.UnsupportedOperation, AttributeError, OSError):
+        return False
+    return True
+
+
+def _stream_upload_to_file(
+    upload: UploadFile,
+    path: str,
+    max_bytes: int,
+    *,
+    field: str,
+    error_code: str,
+) -> None:
+    """
+    Copia o upload para disco validando tamanho e assinatura. Se o Starlette já
+    despejou o upload em disco, copia via sendfile; senão em blocos com um
+    buffer de UPLOAD_CHUNK_BYTES reaproveitado.
+    """
+    src = upload.file
+
+    # Vazio primeiro (400), depois magic bytes (415): lixo com content_type de
+    # imagem não chega ao disco nem à fila. Roda no threadpool, como a cópia.
+    pos = src.tell()
+    head = src.read(_SNIFF_BYTES)
+    src.seek(pos)
+    if not head:
+        raise HTTPException(
+            status_code=400,
+            detail={"error_code": "EMPTY_FILE", "message": "Uploaded file is empty"},
+        )
+    if not _looks_like_image(head):
+        raise HTTPException(
+            status_code=415,
+            detail={
+                "error_code": error_code,
+                "message": f"{field} must be a JPEG, PNG or WebP image",
+            },
+        )
+
+    if _upload_on_disk(upload):
+        written = _copy_with_sendfile(src, path, max_bytes)
+    else:
+        written = _copy_with_buffer(src, path, max_bytes)
+
+    if written > max_bytes:
+        _remove_files(path)
         raise HTTPException(
             status_code=413,
             detail={
@@ -35,60 +177,107 @@ def _read_upload_or_413(upload: UploadFile, max_bytes: int) -> bytes:
                 "message": f"File exceeds max size of {max_bytes} bytes",
             },
         )
-    if not data:
+    if written == 0:
+        _remove_files(path)
         raise HTTPException(
             status_code=400,
             detail={"error_code": "EMPTY_FILE", "message": "Uploaded file is empty"},
         )
-    return data
+
+
+def _request_too_large(request: Request) -> bool:
+    # Dois arquivos + overhead do multipart: acima disso nem olha os arquivos
+    length = request.headers.get("content-length")
+    if not length or not length.isdigit():
+        return False
+    return int(length) > 2 * MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+
+
+def _check_upload(upload: UploadFile, *, field: str, error_code: str) -> None:
+    """
+    Rejeita tipo/tamanho pelo que o Starlette já sabe do upload (content_type e
+    size), sem tocar no arquivo. O limite durante a cópia continua valendo.
+    """
+    if (upload.content_type or "").lower() not in ALLOWED_IMAGE_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail={
+                "error_code": error_code,
+                "message": f"{field} must be a JPEG, PNG or WebP image",
+            },
+        )
+    if upload.size is not None and upload.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail={
+                "error_code": "FILE_TOO_LARGE",
+                "message": f"File exceeds max size of {MAX_UPLOAD_BYTES} bytes",
+            },
+        )
 
 
 def _as_storage_url(path_str: str | None) -> str | None:
     if not path_str:
         return None
-    name = Path(path_str).name
+    name = os.path.basename(path_str)
     return f"/storage/{name}"
 
 
 @router.post("")
-def create_tryon(
+async def create_tryon(
+    request: Request,
     person_image: UploadFile = File(...),
     garment_image: UploadFile = File(...),
-    api_key: ApiKey = Depends(rate_limit),
+    api_key: ApiKeyView = Depends(rate_limit),
     db: Session = Depends(get_db),
 ):
-    if not (person_image.content_type or "").startswith("image/"):
+    # Tudo validado antes de escrever um byte em disco
+    if _request_too_large(request):
         raise HTTPException(
-            status_code=415,
-            detail={
-                "error_code": "INVALID_PERSON_FILE",
-                "message": "person_image must be an image",
-            },
-        )
-
-    if not (garment_image.content_type or "").startswith("image/"):
-        raise HTTPException(
-            status_code=415,
+            status_code=413,
             detail={
-                "error_code": "INVALID_GARMENT_FILE",
-                "message": "garment_image must be an image",
+                "error_code": "FILE_TOO_LARGE",
+                "message": f"Each file must be at most {MAX_UPLOAD_BYTES} bytes",
             },
         )
+    _check_upload(person_image, field="person_image", error_code="INVALID_PERSON_FILE")
+    _check_upload(garment_image, field="garment_image", error_code="INVALID_GARMENT_FILE")
 
-    _ensure_dir(UPLOADS_DIR)
-
-    temp_id = uuid4()
+    # id do job definido antes: uploads vão direto para o caminho final e o
+    # INSERT único já grava id, paths e api_key_id
+    job_id = uuid4()
 
-    person_path = UPLOADS_DIR / f"{temp_id}_person.jpg"
-    garment_path = UPLOADS_DIR / f"{temp_id}_garment.jpg"
+    person_path = f"{_UPLOADS}/{job_id}_person.jpg"
+    garment_path = f"{_UPLOADS}/{job_id}_garment.jpg"
 
-    person_bytes = _read_upload_or_413(person_image, MAX_UPLOAD_BYTES)
-    garment_bytes = _read_upload_or_413(garment_image, MAX_UPLOAD_BYTES)
+    # As duas cópias para disco rodam em paralelo no threadpool (não bloqueiam o event loop)
+    results = await asyncio.gather(
+        run_in_threadpool(
+            _stream_upload_to_file,
+            person_image,
+            person_path,
+            MAX_UPLOAD_BYTES,
+            field="person_image",
+            error_code="INVALID_PERSON_FILE",
+        ),
+        run_in_threadpool(
+            _stream_upload_to_file,
+            garment_image,
+            garment_path,
+            MAX_UPLOAD_BYTES,
+            field="garment_image",
+            error_code="INVALID_GARMENT_FILE",
+        ),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        await run_in_threadpool(_remove_files, person_path, garment_path)
+        raise errors[0]
 
-    person_path.write_bytes(person_bytes)
-    garment_path.write_bytes(garment_bytes)
-
-    job = create_job(db, str(person_path), str(garment_path))
+    job = await run_in_threadpool(
+        create_job, db, person_path, garment_path, job_id=job_id, api_key_id=api_key.id
+    )
 
     return {
         "job_id": str(job.id),
@@ -101,7 +290,7 @@ def create_tryon(
 @router.get("/{job_id}")
 def get_tryon_status(
     job_id: str,
-    api_key: ApiKey = Depends(rate_limit),
+    api_key: ApiKeyView = Depends(rate_limit),
     db: Session = Depends(get_db),
 ):
     job = get_job(db, UUID(job_id))
@@ -125,7 +314,8 @@ def get_tryon_status(
 @router.get("/{job_id}/result")
 def get_tryon_result(
     job_id: str,
-    api_key: ApiKey = Depends(rate_limit),
+    request: Request,
+    api_key: ApiKeyView = Depends(rate_limit),
     db: Session = Depends(get_db),
 ):
     job = get_job(db, UUID(job_id))
@@ -151,11 +341,42 @@ def get_tryon_result(
             },
         )
 
-    if not job.result_image_path or not Path(job.result_image_path).exists():
+    etag = f'"{job.id.hex}"'
+    cache_headers = {"Cache-Control": RESULT_CACHE_CONTROL, "ETag": etag}
+
+    # Revalidação do mesmo cliente: 304 sem tocar no disco
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers)
+
+    # Um único stat: serve de checagem de existência e é repassado ao FileResponse
+    try:
+        stat_result = os.stat(job.result_image_path) if job.result_image_path else None
+    except FileNotFoundError:
+        stat_result = None
+    if stat_result is None:
         raise HTTPException(
             status_code=404,
             detail={"error_code": "RESULT_NOT_FOUND", "message": "Result file not found"},
         )
 
-    # Se seu pipeline escreve PNG, mantenha image/png (se escreve JPG, ajuste aqui)
-    return FileResponse(job.result_image_path, media_type="image/png")
+    # Tipo gravado pelo worker no mark_done (jobs antigos: PNG)
+    media_type = job.result_mime_type or "image/png"
+
+    if RESULTS_ACCEL_REDIRECT_PREFIX:
+        # O Nginx entrega o arquivo (location internal); o processo Python só responde headers
+        name = os.path.basename(job.result_image_path)
+        return Response(
+            headers={
+                **cache_headers,
+                "X-Accel-Redirect": f"{RESULTS_ACCEL_REDIRECT_PREFIX}/{name}",
+                "Content-Type": media_type,
+            },
+        )
+
+    # FileResponse já usa sendfile(2) e suporta Range
+    return FileResponse(
+        job.result_image_path,
+        media_type=media_type,
+        stat_result=stat_result,
+        headers=cache_headers,
+    )
@@ -1,13 +1,33 @@
 # backend/app/core/logging.py
 from __future__ import annotations
 
+import atexit
 import json
+import os
+import queue
+import threading
+import time
+import traceback
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Optional
+from typing import IO, Any, Dict, List, Optional, Tuple
 
 from settings import LOGS_DIR
 
+# Escrita em lote: job_log só enfileira; uma thread de fundo agrupa as linhas
+# por job e mantém os arquivos abertos (sem open/write/close por linha).
+LOG_BATCH_MAX = 256
+LOG_BATCH_WAIT_SECONDS = 0.05
+LOG_IDLE_CLOSE_SECONDS = 5.0
+LOG_MAX_OPEN_FILES = 64
+
+_STOP = object()
+
+_log_q: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+_writer: Optional[threading.Thread] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+
 
 def _utc_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -17,22 +37,132 @@ def _ensure_logs_dir() -> None:
     Path(LOGS_DIR).mkdir(parents=True, exist_ok=True)
 
 
-def job_log(job_id: str, msg: str, *, extra: Optional[dict[str, Any]] = None) -> None:
-    """
-    Log por job em arquivo.
-    Mantém compatibilidade com a assinatura atual e acrescenta opção de 'extra'.
-    O seu arquivo atual grava apenas texto e não cria o diretório. :contentReference[oaicite:3]{index=3}
-    """
+def _drain(first: Any) -> List[Any]:
+    batch = [first]
+    deadline = time.monotonic() + LOG_BATCH_WAIT_SECONDS
+    while len(batch) < LOG_BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_log_q.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write_batch(
+    batch: List[Tuple[str, str]],
+    handles: Dict[str, Tuple[IO[str], float]],
+) -> None:
+    lines_by_job: Dict[str, List[str]] = {}
+    for job_id, line in batch:
+        lines_by_job.setdefault(job_id, []).append(line)
+
+    now = time.monotonic()
+    for job_id, lines in lines_by_job.items():
+        entry = handles.get(job_id)
+        if entry is None:
+            if len(handles) >= LOG_MAX_OPEN_FILES:
+                # fecha o handle usado há mais tempo
+                oldest = min(handles, key=lambda k: handles[k][1])
+                handles.pop(oldest)[0].close()
+            f = (Path(LOGS_DIR) / f"{job_id}.log").open("a", encoding="utf-8")
+        else:
+            f = entry[0]
+        f.write("".join(lines))
+        f.flush()
+        handles[job_id] = (f, now)
+
+
+def _close_idle(handles: Dict[str, Tuple[IO[str], float]], *, max_idle: float) -> None:
+    now = time.monotonic()
+    for job_id in [k for k, (_, ts) in handles.items() if now - ts >= max_idle]:
+        handles.pop(job_id)[0].close()
+
+
+def _writer_main() -> None:
     _ensure_logs_dir()
+    handles: Dict[str, Tuple[IO[str], float]] = {}
+    try:
+        while True:
+            try:
+                first = _log_q.get(timeout=LOG_IDLE_CLOSE_SECONDS)
+            except queue.Empty:
+                _close_idle(handles, max_idle=LOG_IDLE_CLOSE_SECONDS)
+                continue
 
-    p: Path = Path(LOGS_DIR) / f"{job_id}.log"
+            batch = _drain(first)
+            stop = any(item is _STOP for item in batch)
+            lines = [item for item in batch if item is not _STOP]
+            if lines:
+                try:
+                    _write_batch(lines, handles)
+                except OSError:
+                    # log nunca derruba o worker; descarta o lote
+                    pass
+            if stop:
+                return
+            _close_idle(handles, max_idle=LOG_IDLE_CLOSE_SECONDS)
+    finally:
+        _close_idle(handles, max_idle=0.0)
+
+
+def _ensure_writer() -> None:
+    global _writer, _writer_pid
+
+    # depois de fork a thread não existe no filho: recria
+    if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+            return
+        _writer = threading.Thread(target=_writer_main, name="job-log-writer", daemon=True)
+        _writer.start()
+        _writer_pid = os.getpid()
+
+
+@atexit.register
+def flush_job_logs(timeout: float = 5.0) -> None:
+    """Esvazia a fila e fecha os arquivos (chamado no exit do processo)."""
+    global _writer
+
+    writer = _writer
+    if writer is None or _writer_pid != os.getpid() or not writer.is_alive():
+        return
+    _log_q.put(_STOP)
+    writer.join(timeout)
+    with _writer_lock:
+        _writer = None
+
+
+def job_log(
+    job_id: str,
+    msg: str,
+    *,
+    extra: Optional[dict[str, Any]] = None,
+    exc_info: bool = False,
+) -> None:
+    """
+    Log por job em arquivo (uma linha JSON por evento).
+    exc_info=True (dentro de um except) anexa o traceback em extra["traceback"],
+    no mesmo registro da mensagem.
+    A gravação é assíncrona: a linha vai para uma fila e a thread de fundo grava
+    em lote; use flush_job_logs() se precisar garantir que já está em disco.
+    """
     payload = {
         "ts": _utc_iso(),
         "job_id": job_id,
         "message": (msg or "").rstrip(),
     }
+    if exc_info:
+        extra = {**(extra or {}), "traceback": traceback.format_exc()}
     if extra:
         payload["extra"] = extra
 
-    with p.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    _ensure_writer()
+    _log_q.put((str(job_id), json.dumps(payload, ensure_ascii=False) + "\n"))
+
+
+# Nome usado pelo job RQ (app.workers.tryon_jobs)
+log_job = job_log
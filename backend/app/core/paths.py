@@ -1,13 +1,8 @@
 from __future__ import annotations
 
-from pathlib import Path
+# Diretórios definidos (e criados, uma vez por processo) no settings; aqui só
+# reexporta para não repetir o mkdir em cada import.
+from settings import BASE_DIR as BACKEND_DIR  # backend/
+from settings import LOGS_DIR, RESULTS_DIR, STORAGE_DIR, UPLOADS_DIR
 
-BACKEND_DIR = Path(__file__).resolve().parents[2]  # backend/
-STORAGE_DIR = BACKEND_DIR / "storage"
-UPLOADS_DIR = STORAGE_DIR / "uploads"
-RESULTS_DIR = STORAGE_DIR / "results"
-LOGS_DIR = STORAGE_DIR / "logs"
-
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-RESULTS_DIR.mkdir(parents=True, exist_ok=True)
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
+__all__ = ["BACKEND_DIR", "STORAGE_DIR", "UPLOADS_DIR", "RESULTS_DIR", "LOGS_DIR"]
@@ -2,10 +2,10 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
-from uuid import UUID
+from typing import List, Optional, Tuple, Union
+from uuid import UUID, uuid4
 
-from sqlalchemy import func, select
+from sqlalchemy import bindparam, func, select, text, update
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
@@ -19,6 +19,77 @@ from app.infra.db.models import (
     UsageEvent,
     User,
 )
+from app.infra.queue.pg_notify import notify_new_job
+from app.security import api_key_cache
+from app.security.api_key_cache import ApiKeyView
+
+
+# -----------------------------------------------------------------------------
+# Statements dos caminhos quentes: montados uma vez no import, parâmetros
+# via bindparam na execução (mesmo objeto -> hit direto no cache de SQL compilado)
+# -----------------------------------------------------------------------------
+_STMT_GET_API_KEY = select(ApiKey).where(ApiKey.key_hash == bindparam("key_hash"), ApiKey.is_active.is_(True))
+# auth: só as colunas do ApiKeyView (sem hidratar o objeto ORM / parse de DateTime)
+_STMT_GET_API_KEY_VIEW = select(ApiKey.id, ApiKey.key, ApiKey.rpm_limit, ApiKey.is_active).where(
+    ApiKey.key_hash == bindparam("key_hash"), ApiKey.is_active.is_(True)
+)
+
+_STMT_LIST_JOBS = select(TryOnJob).order_by(TryOnJob.created_at.desc()).limit(bindparam("limit"))
+_STMT_LIST_JOBS_BY_STATUS = (
+    select(TryOnJob)
+    .where(TryOnJob.status == bindparam("status"))
+    .order_by(TryOnJob.created_at.desc())
+    .limit(bindparam("limit"))
+)
+
+_STMT_QUEUED_IDS = (
+    select(TryOnJob.id)
+    .where(TryOnJob.status == "queued")
+    .order_by(TryOnJob.created_at.asc())
+    .limit(bindparam("n"))
+)
+_STMT_QUEUED_IDS_LOCKED = _STMT_QUEUED_IDS.with_for_update(skip_locked=True)
+# lote limitado por UPDATE: um acúmulo grande (worker fora do ar) não vira
+# um único UPDATE gigante segurando locks/WAL de uma vez
+FAIL_STUCK_BATCH = 500
+
+_STMT_FAIL_STUCK = (
+    update(TryOnJob)
+    .where(
+        TryOnJob.id.in_(
+            select(TryOnJob.id)
+            .where(
+                TryOnJob.status == "processing",
+                TryOnJob.processing_started_at.is_not(None),
+                TryOnJob.processing_started_at < bindparam("cutoff"),
+            )
+            .limit(bindparam("batch"))
+        ),
+        TryOnJob.status == "processing",
+    )
+    .values(
+        status="error",
+        error_code="WORKER_TIMEOUT",
+        error_message="Job ficou travado em processing e foi finalizado por timeout.",
+        completed_at=bindparam("now"),
+    )
+    .execution_options(synchronize_session=False)
+)
+# SQLite (dev): sem SKIP LOCKED; o claim é um único UPDATE ... WHERE id IN
+# (subquery) RETURNING, atômico porque o SQLite serializa as escritas
+_STMT_CLAIM_QUEUED_SQLITE = (
+    update(TryOnJob)
+    .where(TryOnJob.id.in_(_STMT_QUEUED_IDS), TryOnJob.status == "queued")
+    .values(
+        status="processing",
+        processing_started_at=bindparam("now"),
+        error_code=None,
+        error_message=None,
+        attempts=func.coalesce(TryOnJob.attempts, 0) + 1,
+    )
+    .returning(TryOnJob)
+    .execution_options(synchronize_session=False)
+)
 
 
 def utcnow() -> datetime:
@@ -36,17 +107,35 @@ def _is_sqlite(db: Session) -> bool:
         return False
 
 
+_STMT_ASYNC_COMMIT = text("SET LOCAL synchronous_commit = OFF")
+
+
+def _skip_commit_fsync(db: Session) -> None:
+    """
+    Postgres: o COMMIT desta transação não espera o fsync do WAL.
+    Só para escritas que podem se perder num crash do banco sem dano (o estado
+    é refeito depois: claim volta para a fila/stuck).
+    Nunca corrompe nem reordena; no pior caso some ~3x wal_writer_delay de commits.
+    """
+    if not _is_sqlite(db):
+        db.execute(_STMT_ASYNC_COMMIT)
+
+
 # -----------------------------------------------------------------------------
 # API KEYS
 # -----------------------------------------------------------------------------
+def get_api_key_by_hash(db: Session, key_hash: bytes) -> Optional[ApiKey]:
+    # sem cache aqui: o cache (ApiKeyView) fica em app.security.api_key_cache
+    return db.execute(_STMT_GET_API_KEY, {"key_hash": key_hash}).scalar_one_or_none()
+
+
 def get_api_key(db: Session, key: str) -> Optional[ApiKey]:
-    stmt = select(ApiKey).where(ApiKey.key == key, ApiKey.is_active.is_(True))
-    return db.execute(stmt).scalar_one_or_none()
+    return get_api_key_by_hash(db, ApiKey.hash_key(key))
 
 
-def touch_api_key_last_used(db: Session, api_key: ApiKey) -> None:
-    api_key.last_used_at = utcnow()
-    db.commit()
+def get_api_key_view_by_hash(db: Session, key_hash: bytes) -> Optional[ApiKeyView]:
+    row = db.execute(_STMT_GET_API_KEY_VIEW, {"key_hash": key_hash}).first()
+    return ApiKeyView.from_row(row) if row is not None else None
 
 
 def create_api_key(
@@ -71,10 +160,17 @@ def create_api_key(
     return row
 
 
-def revoke_api_key(db: Session, api_key: ApiKey) -> None:
-    api_key.is_active = False
-    api_key.revoked_at = utcnow()
+def revoke_api_key(db: Session, api_key: Union[ApiKey, ApiKeyView]) -> None:
+    # UPDATE por id: aceita tanto o ApiKey do ORM quanto o ApiKeyView do cache
+    stmt = (
+        update(ApiKey)
+        .where(ApiKey.id == api_key.id)
+        .values(is_active=False, revoked_at=utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(stmt)
     db.commit()
+    api_key_cache.invalidate(ApiKey.hash_key(api_key.key))
 
 
 # -----------------------------------------------------------------------------
@@ -85,132 +181,209 @@ def create_job(
     person_path: str,
     garment_path: str,
     *,
-    tenant_id: Optional[UUID] = None,
+    job_id: Optional[UUID] = None,
     api_key_id: Optional[UUID] = None,
-    requested_by_user_id: Optional[UUID] = None,
 ) -> TryOnJob:
+    # job_id gerado por quem chama permite gravar os uploads já no caminho final
     job = TryOnJob(
+        id=job_id or uuid4(),
         person_image_path=person_path,
         garment_image_path=garment_path,
         status="queued",
-        tenant_id=tenant_id,
         api_key_id=api_key_id,
-        requested_by_user_id=requested_by_user_id,
     )
     db.add(job)
+    db.flush()
+    # NOTIFY vai junto no mesmo commit: workers em LISTEN acordam na hora
+    notify_new_job(db, str(job.id))
+    # Desanexa antes do commit (sem expirar, sem refresh/SELECT depois): quem
+    # chama só usa o que o app definiu (id, status, paths); colunas com
+    # server_default (created_at/updated_at) não vêm carregadas.
+    db.expunge(job)
     db.commit()
-    db.refresh(job)
     return job
 
 
 def get_job(db: Session, job_id: UUID) -> Optional[TryOnJob]:
-    stmt = select(TryOnJob).where(TryOnJob.id == job_id)
-    return db.execute(stmt).scalar_one_or_none()
+    # lookup por PK: identity map primeiro, SQL só se não estiver na sessão
+    return db.get(TryOnJob, job_id)
 
 
 def list_jobs(db: Session, status: Optional[str], limit: int = 50) -> List[TryOnJob]:
-    stmt = select(TryOnJob).order_by(TryOnJob.created_at.desc()).limit(limit)
     if status:
-        stmt = stmt.where(TryOnJob.status == status)
-    return list(db.execute(stmt).scalars().all())
+        result = db.execute(_STMT_LIST_JOBS_BY_STATUS, {"status": status, "limit": limit})
+    else:
+        result = db.execute(_STMT_LIST_JOBS, {"limit": limit})
+    return list(result.scalars().all())
 
 
-def mark_processing(db: Session, job: TryOnJob) -> None:
-    job.status = "processing"
-    job.processing_started_at = utcnow()
-    job.error_code = None
-    job.error_message = None
-    job.attempts = int(job.attempts or 0) + 1
+def _update_job(db: Session, job_id: UUID, *criteria, durable: bool = True, **values) -> int:
+    # UPDATE direto por PK: 1 round-trip, sem carregar/sincronizar o objeto ORM
+    stmt = (
+        update(TryOnJob)
+        .where(TryOnJob.id == job_id, *criteria)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    rowcount = db.execute(stmt).rowcount
+    if not durable:
+        _skip_commit_fsync(db)
     db.commit()
+    return rowcount
 
 
-def mark_done(db: Session, job: TryOnJob, result_path: str, *, processing_ms: Optional[int] = None) -> None:
-    job.status = "done"
-    job.result_image_path = result_path
-    job.completed_at = utcnow()
-    job.processing_ms = processing_ms
-    job.error_code = None
-    job.error_message = None
-    db.commit()
+def mark_processing(db: Session, job_id: UUID) -> bool:
+    """
+    queued -> processing num único UPDATE condicional.
+    Retorna False se outro worker já pegou o job.
+    """
+    return (
+        _update_job(
+            db,
+            job_id,
+            TryOnJob.status == "queued",
+            # perder o flip num crash do banco só devolve o job à fila
+            durable=False,
+            status="processing",
+            processing_started_at=utcnow(),
+            error_code=None,
+            error_message=None,
+            attempts=func.coalesce(TryOnJob.attempts, 0) + 1,
+        )
+        > 0
+    )
 
 
-def mark_error(db: Session, job: TryOnJob, error_code: str, error_message: str) -> None:
-    job.status = "error"
-    job.error_code = error_code
-    job.error_message = (error_message or "")[:2000]
-    job.completed_at = utcnow()
-    db.commit()
+def mark_done(
+    db: Session,
+    job_id: UUID,
+    result_path: str,
+    *,
+    mime_type: str = "image/png",
+) -> bool:
+    """
+    processing -> done. Retorna False se o job já saiu de processing
+    (ex.: fail_stuck_jobs marcou WORKER_TIMEOUT): o erro não é sobrescrito.
+    """
+    return (
+        _update_job(
+            db,
+            job_id,
+            TryOnJob.status == "processing",
+            status="done",
+            result_image_path=result_path,
+            result_mime_type=mime_type,
+            completed_at=utcnow(),
+            error_code=None,
+            error_message=None,
+        )
+        > 0
+    )
+
+
+def mark_error(db: Session, job_id: UUID, error_code: str, error_message: str) -> bool:
+    # mesma guarda do mark_done: só finaliza o que ainda está em processing
+    return (
+        _update_job(
+            db,
+            job_id,
+            TryOnJob.status == "processing",
+            status="error",
+            error_code=error_code,
+            error_message=(error_message or "")[:2000],
+            completed_at=utcnow(),
+        )
+        > 0
+    )
 
 
-def fail_stuck_jobs(db: Session, timeout_seconds: int = 240) -> int:
+def fail_stuck_jobs(db: Session, timeout_seconds: int = 240, *, batch: int = FAIL_STUCK_BATCH) -> int:
+    # UPDATE em lotes de `batch` (usa ix_tryon_status_proc_started), sem SELECT
+    # nem objetos ORM; um commit por lote
     now = utcnow()
     cutoff = now - timedelta(seconds=timeout_seconds)
+    params = {"cutoff": cutoff, "now": now, "batch": batch}
 
-    stmt = select(TryOnJob).where(
-        TryOnJob.status == "processing",
-        TryOnJob.processing_started_at.is_not(None),
-        TryOnJob.processing_started_at < cutoff,
+    total = 0
+    while True:
+        rowcount = db.execute(_STMT_FAIL_STUCK, params).rowcount
+        if not rowcount:
+            db.rollback()
+            return total
+        # idempotente: se o commit se perder, o próximo ciclo marca de novo
+        _skip_commit_fsync(db)
+        db.commit()
+        total += rowcount
+        if rowcount < batch:
+            return total
+
+
+def _claim_ids(db: Session, ids: List[UUID]) -> List[TryOnJob]:
+    # Um único UPDATE ... RETURNING para o lote; status == queued protege o caminho sem lock
+    stmt = (
+        update(TryOnJob)
+        .where(TryOnJob.id.in_(ids), TryOnJob.status == "queued")
+        .values(
+            status="processing",
+            processing_started_at=utcnow(),
+            error_code=None,
+            error_message=None,
+            attempts=func.coalesce(TryOnJob.attempts, 0) + 1,
+        )
+        .returning(TryOnJob)
+        .execution_options(synchronize_session=False)
     )
     jobs = list(db.execute(stmt).scalars().all())
-
+    # RETURNING não garante ordem: mantém a ordem da fila (created_at)
+    order = {job_id: i for i, job_id in enumerate(ids)}
+    jobs.sort(key=lambda j: order[j.id])
+    # Desanexa antes do commit: o estado vindo do RETURNING já está atualizado,
+    # então não há refresh (SELECT) por job depois do commit.
     for j in jobs:
-        j.status = "error"
-        j.error_code = "WORKER_TIMEOUT"
-        j.error_message = "Job ficou travado em processing e foi finalizado por timeout."
-        j.completed_at = now
+        db.expunge(j)
+    _skip_commit_fsync(db)
+    db.commit()
+    return jobs
 
-    if jobs:
-        db.commit()
 
-    return len(jobs)
+def _claim_sqlite(db: Session, params: dict) -> List[TryOnJob]:
+    jobs = list(db.execute(_STMT_CLAIM_QUEUED_SQLITE, {**params, "now": utcnow()}).scalars().all())
+    jobs.sort(key=lambda j: j.created_at)
+    for j in jobs:
+        db.expunge(j)
+    db.commit()
+    return jobs
 
 
-def claim_next_job(db: Session) -> Optional[TryOnJob]:
+def claim_next_jobs(db: Session, n: int = 1) -> List[TryOnJob]:
+    """
+    Claim de até n jobs queued numa transação (FOR UPDATE SKIP LOCKED + 1 UPDATE;
+    no SQLite, um único UPDATE ... RETURNING). Os jobs voltam desanexados da sessão, já com status=processing.
+    """
+    params = {"n": n}
+    if _is_sqlite(db):
+        return _claim_sqlite(db, params)
+
     try:
-        stmt = (
-            select(TryOnJob)
-            .where(TryOnJob.status == "queued")
-            .order_by(TryOnJob.created_at.asc())
-            .with_for_update(skip_locked=True)
-            .limit(1)
-        )
-        job = db.execute(stmt).scalar_one_or_none()
-        if not job:
+        ids = list(db.execute(_STMT_QUEUED_IDS_LOCKED, params).scalars().all())
+        if not ids:
             db.rollback()
-            return None
-
-        job.status = "processing"
-        job.processing_started_at = utcnow()
-        job.error_code = None
-        job.error_message = None
-        job.attempts = int(job.attempts or 0) + 1
-
-        db.commit()
-        db.refresh(job)
-        return job
+            return []
+        return _claim_ids(db, ids)
 
     except (OperationalError, TypeError):
         db.rollback()
 
-        stmt = (
-            select(TryOnJob)
-            .where(TryOnJob.status == "queued")
-            .order_by(TryOnJob.created_at.asc())
-            .limit(1)
-        )
-        job = db.execute(stmt).scalar_one_or_none()
-        if not job:
-            return None
+        ids = list(db.execute(_STMT_QUEUED_IDS, params).scalars().all())
+        if not ids:
+            db.rollback()
+            return []
+        return _claim_ids(db, ids)
 
-        job.status = "processing"
-        job.processing_started_at = utcnow()
-        job.error_code = None
-        job.error_message = None
-        job.attempts = int(job.attempts or 0) + 1
 
-        db.commit()
-        db.refresh(job)
-        return job
+def claim_next_job(db: Session) -> Optional[TryOnJob]:
+    jobs = claim_next_jobs(db, n=1)
+    return jobs[0] if jobs else None
 
 
 # -----------------------------------------------------------------------------
@@ -297,7 +470,10 @@ def get_plan_for_tenant(db: Session, tenant_id: UUID) -> Plan:
         if plan:
             return plan
         raise ValueError("NO_PLAN_CONFIGURED")
-    return db.execute(select(Plan).where(Plan.id == sub.plan_id)).scalar_one()
+    plan = db.get(Plan, sub.plan_id)
+    if plan is None:
+        raise ValueError("NO_PLAN_CONFIGURED")
+    return plan
 
 
 # -----------------------------------------------------------------------------
@@ -325,24 +501,24 @@ def record_usage_event(
     return ev
 
 
+def _utc_day_bounds(now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    start = (now or utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
 def count_usage_today(db: Session, tenant_id: UUID, *, event_type: str = "tryon_created") -> int:
     """
-    Compatível com Postgres e SQLite.
-    - Postgres: date_trunc('day', ...)
-    - SQLite: strftime('%Y-%m-%d', ...)
+    Uso do dia (UTC) como intervalo semiaberto [00:00, 00:00 do dia seguinte).
+    Sem função sobre created_at: o índice (tenant_id, event_type, created_at) é usado
+    e a mesma query serve para Postgres e SQLite.
     """
-    if _is_sqlite(db):
-        stmt = select(func.coalesce(func.sum(UsageEvent.units), 0)).where(
-            UsageEvent.tenant_id == tenant_id,
-            UsageEvent.event_type == event_type,
-            func.strftime("%Y-%m-%d", UsageEvent.created_at) == func.strftime("%Y-%m-%d", func.current_timestamp()),
-        )
-    else:
-        stmt = select(func.coalesce(func.sum(UsageEvent.units), 0)).where(
-            UsageEvent.tenant_id == tenant_id,
-            UsageEvent.event_type == event_type,
-            func.date_trunc("day", UsageEvent.created_at) == func.date_trunc("day", func.now()),
-        )
+    start, end = _utc_day_bounds()
+    stmt = select(func.coalesce(func.sum(UsageEvent.units), 0)).where(
+        UsageEvent.tenant_id == tenant_id,
+        UsageEvent.event_type == event_type,
+        UsageEvent.created_at >= start,
+        UsageEvent.created_at < end,
+    )
 
     return int(db.execute(stmt).scalar_one() or 0)
 
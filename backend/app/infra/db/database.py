@@ -1,12 +1,22 @@
 # backend/app/infra/db/database.py
 from __future__ import annotations
 
-from typing import Generator
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Generator, Iterator, Optional
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, declarative_base, scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
 
-from settings import DATABASE_URL
+from settings import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+)
 
 # Engine
 _engine_kwargs = {
@@ -14,20 +24,80 @@ _engine_kwargs = {
     "future": True,
 }
 
-# SQLite precisa de connect_args específicos
-if DATABASE_URL.startswith("sqlite"):
+_IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+if _IS_SQLITE:
+    # SQLite precisa de connect_args específicos.
+    # Arquivo: pool padrão (conexões reaproveitadas, PRAGMAs aplicados uma vez por conexão).
+    # Em memória, uma única conexão compartilhada (senão cada conexão vê um banco vazio).
     _engine_kwargs["connect_args"] = {"check_same_thread": False}
+    is_memory = DATABASE_URL in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in DATABASE_URL
+    if is_memory:
+        _engine_kwargs["poolclass"] = StaticPool
+else:
+    _engine_kwargs.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        # LIFO: reaproveita a conexão mais quente; as ociosas no fundo da pilha
+        # expiram pelo pool_recycle em vez de ficarem todas abertas girando
+        pool_use_lifo=True,
+    )
 
 engine = create_engine(DATABASE_URL, **_engine_kwargs)
 
+if _IS_SQLITE:
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record) -> None:
+        # WAL: leitores não bloqueiam o writer; NORMAL: sem fsync a cada commit
+        # (só no checkpoint). busy_timeout: espera o lock em vez de "database is locked".
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA busy_timeout=5000")
+        cur.close()
+
 # Session factory
+# expire_on_commit=False: ler um atributo depois do commit não dispara outro
+# SELECT. Quem precisa de colunas geradas no servidor faz refresh explícito.
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
+    expire_on_commit=False,
     bind=engine,
     future=True,
 )
 
+# Session por request: auth e rota compartilham a mesma Session (uma conexão
+# do pool por request, não uma por dependência). O escopo vem de um ContextVar
+# setado pelo middleware (app.api.main), que o copia para as threads do
+# threadpool; fora de request (workers/scripts) cai no escopo por thread.
+_request_scope: ContextVar[Optional[object]] = ContextVar("db_request_scope", default=None)
+
+
+def _session_scope() -> object:
+    scope = _request_scope.get()
+    return scope if scope is not None else threading.get_ident()
+
+
+ScopedSession = scoped_session(SessionLocal, scopefunc=_session_scope)
+
+
+def begin_request_scope() -> object:
+    """Abre um escopo de Session para o request corrente (retorna o token)."""
+    return _request_scope.set(object())
+
+
+def end_request_scope(token: object) -> None:
+    """Fecha a Session do escopo (se alguma foi criada) e restaura o anterior."""
+    try:
+        ScopedSession.remove()
+    finally:
+        _request_scope.reset(token)
+
+
 # Base (models herdam daqui)
 Base = declarative_base()
 
@@ -41,7 +111,21 @@ def init_db() -> None:
 
 def get_db() -> Generator:
     """
-    Dependency do FastAPI.
+    Dependency do FastAPI (Session do escopo do request; o middleware a remove).
+    """
+    db = ScopedSession()
+    try:
+        yield db
+    finally:
+        # devolve a conexão ao pool já aqui; remove() no fim do request descarta a Session
+        db.close()
+
+
+@contextmanager
+def worker_session() -> Iterator[Session]:
+    """
+    Session de vida longa para o loop de um worker (uma por thread), em vez de
+    SessionLocal() + close() por job. Use get_db() nas rotas.
     """
     db = SessionLocal()
     try:
@@ -1,8 +1,9 @@
 # backend/app/infra/db/models.py
+import hashlib
 import secrets
 import uuid
 
-from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, LargeBinary, String, Text, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 
@@ -11,6 +12,19 @@ from app.infra.db.database import Base
 
 class TryOnJob(Base):
     __tablename__ = "tryon_jobs"
+    __table_args__ = (
+        # list_jobs / claim (status + ordem de chegada)
+        Index("ix_tryon_status_created_at", "status", "created_at"),
+        # fail_stuck_jobs (varre só a cauda em processing)
+        Index("ix_tryon_status_proc_started", "status", "processing_started_at"),
+        # cabeça da fila: índice parcial só com os queued
+        Index(
+            "ix_tryon_queued_created_at",
+            "created_at",
+            postgresql_where=text("status = 'queued'"),
+            sqlite_where=text("status = 'queued'"),
+        ),
+    )
 
     # queued | processing | done | error
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -20,6 +34,12 @@ class TryOnJob(Base):
     person_image_path = Column(String, nullable=False)
     garment_image_path = Column(String, nullable=False)
     result_image_path = Column(String, nullable=True)
+    # gravado pelo worker junto com o resultado; evita adivinhar o tipo na leitura
+    result_mime_type = Column(String, nullable=True)
+
+    # chave que criou o job (gravada no create_tryon); indexada para os filtros
+    # por dono não varrerem a tabela
+    api_key_id = Column(UUID(as_uuid=True), nullable=True, index=True)
 
     error_code = Column(String, nullable=True)
     error_message = Column(Text, nullable=True)
@@ -44,7 +64,16 @@ class ApiKey(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
     name = Column(String, nullable=False, default="default")
-    key = Column(String, nullable=False, unique=True, index=True)
+    key = Column(String, nullable=False)
+    # lookup/cache pelo digest (16 bytes) em vez da string da chave;
+    # preenchido automaticamente a partir de `key` no INSERT
+    key_hash = Column(
+        LargeBinary(16),
+        nullable=False,
+        unique=True,
+        index=True,
+        default=lambda ctx: ApiKey.hash_key(ctx.get_current_parameters()["key"]),
+    )
 
     is_active = Column(Boolean, nullable=False, default=True)
     rpm_limit = Column(Integer, nullable=False, default=60)
@@ -54,3 +83,7 @@ class ApiKey(Base):
     @staticmethod
     def generate() -> str:
         return secrets.token_urlsafe(32)
+
+    @staticmethod
+    def hash_key(key: str) -> bytes:
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
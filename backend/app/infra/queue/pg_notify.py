@@ -0,0 +1,65 @@
+# backend/app/infra/queue/pg_notify.py
+from __future__ import annotations
+
+import select
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Canal avisado a cada job novo (NOTIFY) e escutado pelos workers (LISTEN)
+JOBS_CHANNEL = "tryon_jobs"
+
+
+def notify_new_job(db: Session, job_id: str) -> None:
+    """
+    Agenda o aviso na transação corrente; o Postgres só entrega no commit.
+    No-op fora do Postgres.
+    """
+    if db.bind is None or db.bind.dialect.name != "postgresql":
+        return
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": JOBS_CHANNEL, "payload": job_id})
+
+
+class JobListener:
+    """
+    Conexão dedicada em LISTEN: o worker bloqueia em select() até chegar um
+    NOTIFY (ou estourar o timeout) em vez de dormir um intervalo fixo.
+    """
+
+    def __init__(self, engine: Engine) -> None:
+        self._raw = engine.raw_connection()
+        # conexão fica fora do pool (autocommit + LISTEN não devem voltar para outros usos)
+        self._raw.detach()
+        self._conn = self._raw.driver_connection
+        self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute(f"LISTEN {JOBS_CHANNEL}")
+
+    @classmethod
+    def open(cls, engine: Engine) -> Optional["JobListener"]:
+        if engine.dialect.name != "postgresql":
+            return None
+        return cls(engine)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Retorna True se chegou ao menos um aviso. Avisos acumulados são
+        descartados: o worker sempre faz claim do próximo job da fila.
+        """
+        if self._conn.notifies:
+            self._conn.notifies.clear()
+            return True
+
+        ready, _, _ = select.select([self._conn], [], [], timeout)
+        if not ready:
+            return False
+
+        self._conn.poll()
+        got = bool(self._conn.notifies)
+        self._conn.notifies.clear()
+        return got
+
+    def close(self) -> None:
+        self._raw.close()
@@ -0,0 +1,32 @@
+# backend/app/infra/queue/redis_pool.py
+from __future__ import annotations
+
+from threading import Lock
+from typing import Optional
+
+from settings import REDIS_URL
+
+# Um único pool por processo: fila (RQ) e rate limiter dividem as conexões,
+# em vez de cada chamada abrir pool/conexão novos a partir da URL.
+REDIS_MAX_CONNECTIONS = 32
+
+_client = None
+_client_lock = Lock()
+
+
+def get_redis(url: Optional[str] = None):
+    """Cliente Redis compartilhado (criado no 1º uso; exige REDIS_URL)."""
+    global _client
+
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            import redis  # dependência só necessária com REDIS_URL configurado
+
+            redis_url = url or REDIS_URL
+            if not redis_url:
+                raise RuntimeError("REDIS_URL não configurado")
+            pool = redis.ConnectionPool.from_url(redis_url, max_connections=REDIS_MAX_CONNECTIONS)
+            _client = redis.Redis(connection_pool=pool)
+    return _client
@@ -1,11 +1,19 @@
 from __future__ import annotations
 
-import redis
+from typing import Optional
+
 from rq import Queue
 
-from app.core.config import REDIS_URL
+from app.infra.queue.redis_pool import get_redis
+from settings import RQ_JOB_TIMEOUT
+
+_queue: Optional[Queue] = None
 
 
 def get_queue() -> Queue:
-    conn = redis.from_url(REDIS_URL)
-    return Queue("tryon", connection=conn)
+    # Queue e conexão criadas uma vez; o pool é o mesmo do rate limiter
+    global _queue
+
+    if _queue is None:
+        _queue = Queue("tryon", connection=get_redis(), default_timeout=RQ_JOB_TIMEOUT)
+    return _queue
@@ -0,0 +1,100 @@
+# backend/app/security/api_key_cache.py
+from __future__ import annotations
+
+import time
+from threading import RLock
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+# Cache em processo das chaves válidas: em hit, require_api_key não abre Session.
+# Indexado pelo digest da chave (ApiKey.hash_key), nunca pela chave em texto.
+# Revogação pelo revoke_api_key invalida na hora (neste processo); nos demais,
+# revogação/alteração de rpm_limit leva no máximo API_KEY_CACHE_TTL para valer.
+API_KEY_CACHE_TTL = 60.0
+API_KEY_CACHE_MAX = 10_000
+
+# Cache negativo: chaves inválidas vistas há pouco respondem 401 sem ir ao banco
+# (flood de chave errada/credential stuffing não vira 1 query por request).
+# TTL curto: uma chave recém-criada passa a valer em até INVALID_KEY_CACHE_TTL.
+INVALID_KEY_CACHE_TTL = 30.0
+INVALID_KEY_CACHE_MAX = 50_000
+
+
+class ApiKeyView(NamedTuple):
+    """Snapshot imutável do que as rotas usam da ApiKey (sem ORM/Session)."""
+
+    id: UUID
+    key: str
+    rpm_limit: int
+    is_active: bool
+
+    @classmethod
+    def from_row(cls, row: Any) -> "ApiKeyView":
+        return cls(
+            id=row.id,
+            key=row.key,
+            rpm_limit=int(row.rpm_limit or 60),
+            is_active=bool(row.is_active),
+        )
+
+
+_cache: Dict[bytes, Tuple[float, ApiKeyView]] = {}
+_invalid: Dict[bytes, float] = {}
+_lock = RLock()
+
+
+def get(key_hash: bytes) -> Optional[ApiKeyView]:
+    with _lock:
+        hit = _cache.get(key_hash)
+        if hit is None:
+            return None
+        expires_at, view = hit
+        if expires_at < time.monotonic():
+            del _cache[key_hash]
+            return None
+        return view
+
+
+def put(key_hash: bytes, view: ApiKeyView) -> None:
+    with _lock:
+        if len(_cache) >= API_KEY_CACHE_MAX and key_hash not in _cache:
+            # descarta primeiro os expirados; se não bastar, esvazia
+            now = time.monotonic()
+            for k in [k for k, (exp, _) in _cache.items() if exp < now]:
+                del _cache[k]
+            if len(_cache) >= API_KEY_CACHE_MAX:
+                _cache.clear()
+        _cache[key_hash] = (time.monotonic() + API_KEY_CACHE_TTL, view)
+
+
+def invalidate(key_hash: Optional[bytes] = None) -> None:
+    with _lock:
+        if key_hash is None:
+            _cache.clear()
+            _invalid.clear()
+        else:
+            _cache.pop(key_hash, None)
+            _invalid.pop(key_hash, None)
+
+
+def is_known_invalid(key_hash: bytes) -> bool:
+    with _lock:
+        expires_at = _invalid.get(key_hash)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del _invalid[key_hash]
+            return False
+        return True
+
+
+def mark_invalid(key_hash: bytes) -> None:
+    with _lock:
+        _cache.pop(key_hash, None)
+        if len(_invalid) >= INVALID_KEY_CACHE_MAX and key_hash not in _invalid:
+            now = time.monotonic()
+            for k in [k for k, exp in _invalid.items() if exp < now]:
+                del _invalid[k]
+            if len(_invalid) >= INVALID_KEY_CACHE_MAX:
+                _invalid.clear()
+        _invalid[key_hash] = time.monotonic() + INVALID_KEY_CACHE_TTL
@@ -1,29 +1,50 @@
 # backend/app/security/auth.py
 from __future__ import annotations
 
-from fastapi import Depends, Header, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import Header, HTTPException
 
-from app.infra.db.crud import get_api_key
-from app.infra.db.database import get_db
+from app.infra.db.crud import get_api_key_view_by_hash
+from app.infra.db.database import ScopedSession
 from app.infra.db.models import ApiKey
+from app.security import api_key_cache
+from app.security.api_key_cache import ApiKeyView
+
+
+def _invalid_api_key() -> HTTPException:
+    return HTTPException(
+        status_code=401,
+        detail={"error_code": "INVALID_API_KEY", "message": "Invalid API key"},
+    )
+
+
+def _lookup_api_key(key_hash: bytes) -> ApiKeyView | None:
+    # só em cache miss (em hit nenhuma Session é criada); usa a Session do
+    # request, a mesma que a rota recebe via get_db
+    db = ScopedSession()
+    return get_api_key_view_by_hash(db, key_hash)
 
 
 def require_api_key(
     x_api_key: str = Header(default="", alias="X-API-Key"),
-    db: Session = Depends(get_db),
-) -> ApiKey:
+) -> ApiKeyView:
     if not x_api_key:
         raise HTTPException(
             status_code=401,
             detail={"error_code": "NO_API_KEY", "message": "Missing X-API-Key"},
         )
 
-    row = get_api_key(db, x_api_key)
-    if not row:
-        raise HTTPException(
-            status_code=401,
-            detail={"error_code": "INVALID_API_KEY", "message": "Invalid API key"},
-        )
+    key_hash = ApiKey.hash_key(x_api_key)
+    view = api_key_cache.get(key_hash)
+    if view is not None:
+        return view
+
+    if api_key_cache.is_known_invalid(key_hash):
+        raise _invalid_api_key()
+
+    view = _lookup_api_key(key_hash)
+    if view is None:
+        api_key_cache.mark_invalid(key_hash)
+        raise _invalid_api_key()
 
-    return row
+    api_key_cache.put(key_hash, view)
+    return view
@@ -2,27 +2,61 @@
 from __future__ import annotations
 
 import time
-from collections import defaultdict
 from threading import Lock
-from typing import Dict
+from typing import Dict, List
 
 from fastapi import HTTPException
 
+# detail do 429 montado uma vez por rpm_limit: no caminho de rejeição (flood)
+# cada request só cria a exceção. A exceção em si não é reaproveitada (o
+# traceback de uma instância re-levantada vai acumulando frames).
+_RATE_LIMIT_DETAILS: Dict[int, dict] = {}
+_RATE_LIMIT_DETAILS_MAX = 1024
 
-class SimpleRateLimiter:
-    """
-    Limiter simples em memória (token bucket).
-    Em produção, isso vira Redis/Upstash, mas mantém o código limpo agora. :contentReference[oaicite:5]{index=5}
+
+def rate_limit_exceeded(rpm_limit: int) -> HTTPException:
+    detail = _RATE_LIMIT_DETAILS.get(rpm_limit)
+    if detail is None:
+        detail = {
+            "error_code": "RATE_LIMIT",
+            "message": "Too many requests. Slow down.",
+            "details": {"rpm_limit": rpm_limit},
+        }
+        if len(_RATE_LIMIT_DETAILS) < _RATE_LIMIT_DETAILS_MAX:
+            _RATE_LIMIT_DETAILS[rpm_limit] = detail
+    return HTTPException(status_code=429, detail=detail)
+
+
+_NS_PER_MINUTE = 60_000_000_000
+# intervalo entre varreduras de um shard para descartar chaves ociosas
+_PRUNE_INTERVAL_NS = _NS_PER_MINUTE
+
+
+class ShardedRateLimiter:
     """
+    Rate limit em memória (por processo) equivalente a um token bucket com
+    cap = rpm_limit e refill de rpm_limit / 60 tokens/s. As chaves ficam
+    divididas em shards (hash(key) & mask), cada um com seu Lock: chaves
+    diferentes raramente disputam o mesmo mutex.
 
-    def __init__(self) -> None:
-        self._lock = Lock()
-        self._buckets: Dict[str, dict] = defaultdict(self._new_bucket)
+    O bucket é guardado na forma GCRA: um único int por chave, o "tempo teórico
+    de chegada" (tat) em ns de monotonic_ns. Cada request empurra o tat em
+    T = 1min / rpm_limit; estoura quando o tat passa de now + (cap - 1) * T.
+    É equivalente ao token bucket e só usa aritmética inteira.
+    Como tat <= now é o mesmo que bucket cheio, não existe refill: chaves
+    ociosas só são descartadas, numa varredura por shard a cada minuto
+    (feita pelo próprio check, sem thread de fundo).
+    """
 
-    @staticmethod
-    def _new_bucket() -> dict:
-        # Começa com tokens "cheios" para permitir burst inicial controlado.
-        return {"tokens": 0.0, "ts": time.monotonic(), "cap": 0.0}
+    def __init__(self, shards: int = 64) -> None:
+        if shards <= 0 or shards & (shards - 1):
+            raise ValueError("shards deve ser potência de 2")
+        self._mask = shards - 1
+        self._locks = [Lock() for _ in range(shards)]
+        # key -> tat (ns); a capacidade vem do rpm_limit de cada chamada
+        self._shards: List[Dict[str, int]] = [{} for _ in range(shards)]
+        now = time.monotonic_ns()
+        self._next_prune: List[int] = [now + _PRUNE_INTERVAL_NS] * shards
 
     def check(self, key: str, rpm_limit: int) -> None:
         """
@@ -31,34 +65,24 @@ class SimpleRateLimiter:
         if rpm_limit <= 0:
             return
 
-        now = time.monotonic()
-        refill_per_sec = float(rpm_limit) / 60.0
-        cap = float(rpm_limit)
-
-        with self._lock:
-            b = self._buckets[key]
-
-            # Se o limite mudou, ajuste a capacidade e (se era zero) encha
-            if b["cap"] != cap:
-                b["cap"] = cap
-                # Se bucket estava "vazio inicial", dá burst inicial igual ao cap
-                if b["tokens"] <= 0.0:
-                    b["tokens"] = cap
-
-            elapsed = now - b["ts"]
-            b["ts"] = now
-
-            # Refill
-            b["tokens"] = min(cap, float(b["tokens"]) + elapsed * refill_per_sec)
-
-            if b["tokens"] < 1.0:
-                raise HTTPException(
-                    status_code=429,
-                    detail={
-                        "error_code": "RATE_LIMIT",
-                        "message": "Too many requests. Slow down.",
-                        "details": {"rpm_limit": rpm_limit},
-                    },
-                )
-
-            b["tokens"] -= 1.0
+        now = time.monotonic_ns()
+        interval = _NS_PER_MINUTE // rpm_limit
+        tolerance = interval * (rpm_limit - 1)
+
+        idx = hash(key) & self._mask
+        with self._locks[idx]:
+            buckets = self._shards[idx]
+            if now >= self._next_prune[idx]:
+                self._next_prune[idx] = now + _PRUNE_INTERVAL_NS
+                for k in [k for k, t in buckets.items() if t <= now]:
+                    del buckets[k]
+
+            # chave nova (ou ociosa): tat <= now = bucket cheio
+            tat = buckets.get(key, now)
+            if tat < now:
+                tat = now
+
+            if tat - now > tolerance:
+                raise rate_limit_exceeded(rpm_limit)
+
+            buckets[key] = tat + interval
@@ -0,0 +1,130 @@
+# backend/app/security/redis_rate_limiter.py
+from __future__ import annotations
+
+import atexit
+import time
+from threading import Lock
+from typing import Dict, List, Optional
+
+from app.security.rate_limiter import ShardedRateLimiter, rate_limit_exceeded
+from settings import RATE_LIMIT_BORROW_BATCH
+
+# Janela fixa por minuto: rl:{api_key}:{minuto} num script Lua (1 round trip,
+# atômico; vale para todos os workers/réplicas). Um int por chave ativa no
+# Redis; a chave some sozinha após a janela.
+WINDOW_SECONDS = 60
+KEY_TTL_SECONDS = WINDOW_SECONDS + 10
+
+KEY_PREFIX = "rl:"
+
+# Reserva até ARGV[1] tokens sem passar de ARGV[2]: só soma o que concedeu, então
+# chamadas rejeitadas não inflam o contador. Retorna quantos foram concedidos.
+_BORROW_LUA = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = math.min(tonumber(ARGV[1]), tonumber(ARGV[2]) - used)
+if granted <= 0 then
+    return 0
+end
+redis.call('INCRBY', KEYS[1], granted)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return granted
+"""
+
+
+class RedisRateLimiter:
+    """
+    Contador de janela fixa (rpm_limit requests por minuto de relógio) no Redis.
+    Mais simples que o token bucket em memória; o custo é permitir até 2x o
+    limite na virada do minuto.
+    Com borrow_batch > 1 cada processo reserva até batch tokens por ida ao
+    Redis e os consome localmente (~batch x menos round trips), mas os não
+    usados ficam presos no processo até o fim da janela: com N processos a
+    chave pode levar 429 após rpm_limit - N x (batch - 1) requests. Por isso
+    o padrão é 1 (contrato exato) e o batch é limitado a rpm_limit // 10.
+    Se o Redis cair, degrada para o limiter em memória do processo em vez de
+    derrubar as requisições.
+    """
+
+    def __init__(
+        self,
+        client,
+        *,
+        fallback: Optional[ShardedRateLimiter] = None,
+        borrow_batch: int = RATE_LIMIT_BORROW_BATCH,
+    ) -> None:
+        import redis  # dependência só necessária com REDIS_URL configurado
+
+        self._redis_error = redis.RedisError
+        # cliente compartilhado (app.infra.queue.redis_pool.get_redis)
+        self._client = client
+        self._borrow_script = client.register_script(_BORROW_LUA)
+        self._fallback = fallback or ShardedRateLimiter()
+        self._borrow_batch = max(1, int(borrow_batch))
+
+        # tokens reservados da janela corrente: chave -> restantes
+        self._local: Dict[str, List[int]] = {}
+        self._local_window = -1
+        self._lock = Lock()
+        atexit.register(self.return_tokens)
+
+    def _take_local(self, key: str, window: int) -> bool:
+        with self._lock:
+            if window != self._local_window:
+                # virou o minuto: o que sobrou da janela anterior não vale mais
+                self._local.clear()
+                self._local_window = window
+                return False
+            slot = self._local.get(key)
+            if slot is None or slot[0] <= 0:
+                return False
+            slot[0] -= 1
+            return True
+
+    def _borrow(self, rkey: str, n: int, rpm_limit: int) -> int:
+        # EXPIRE sem NX (Redis < 7): renovar o TTL da janela corrente é inofensivo
+        return int(self._borrow_script(keys=[rkey], args=[n, rpm_limit, KEY_TTL_SECONDS]))
+
+    def check(self, key: str, rpm_limit: int) -> None:
+        """
+        Consome 1 request na janela do minuto corrente; 429 acima de rpm_limit.
+        """
+        if rpm_limit <= 0:
+            return
+
+        window = int(time.time()) // WINDOW_SECONDS
+        if self._take_local(key, window):
+            return
+
+        # limites baixos não reservam em lote: poucos tokens presos já dariam 429 falso
+        n = max(1, min(self._borrow_batch, rpm_limit // 10))
+        rkey = f"{KEY_PREFIX}{key}:{window}"
+        try:
+            granted = self._borrow(rkey, n, rpm_limit)
+        except self._redis_error:
+            self._fallback.check(key, rpm_limit)
+            return
+
+        if granted <= 0:
+            raise rate_limit_exceeded(rpm_limit)
+
+        if granted > 1:
+            with self._lock:
+                if window == self._local_window:
+                    slot = self._local.setdefault(key, [0])
+                    slot[0] += granted - 1
+
+    def return_tokens(self) -> None:
+        """Devolve ao Redis os tokens reservados e não usados da janela corrente."""
+        with self._lock:
+            window = self._local_window
+            pending = {k: slot[0] for k, slot in self._local.items() if slot[0] > 0}
+            self._local.clear()
+        if not pending or window != int(time.time()) // WINDOW_SECONDS:
+            return
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for key, n in pending.items():
+                pipe.decrby(f"{KEY_PREFIX}{key}:{window}", n)
+            pipe.execute()
+        except self._redis_error:
+            pass
@@ -5,63 +5,80 @@ from pathlib import Path
 from uuid import UUID
 
 import cv2
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 
 from app.core.logging import log_job
-from app.core.paths import RESULTS_DIR, LOGS_DIR
+from app.core.paths import RESULTS_DIR
+from app.infra.db.crud import mark_done, mark_error, mark_processing
 from app.infra.db.database import SessionLocal
 from app.infra.db.models import TryOnJob
 from app.ai.image_utils import (
-    garment_cutout_auto_bgra,
+    load_garment_cutout_bgra,
     overlay_bgra_on_bgr,
+    resize_garment,
+    PNG_ENCODE_PARAMS,
+)
+from app.ai.pose import detect_torso_anchor_mediapipe
+
+# só as colunas que o job usa, sem hidratar o objeto ORM
+_STMT_JOB_PATHS = select(TryOnJob.person_image_path, TryOnJob.garment_image_path).where(
+    TryOnJob.id == bindparam("id")
 )
-from app.ai.pose_utils import detect_torso_anchor_mediapipe  # se o seu está em outro arquivo, ajuste o import
 
 
-def _read_bgr(path: Path):
-    img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+def _read_bgr(path: Path, flags: int = cv2.IMREAD_COLOR):
+    img = cv2.imread(str(path), flags)
     if img is None:
         raise ValueError(f"Failed to read image: {path}")
     return img
 
 
-def process_tryon_job(job_id: str) -> None:
-    db: Session = SessionLocal()
-    try:
-        jid = UUID(job_id)
-        job = db.query(TryOnJob).filter(TryOnJob.id == jid).first()
-        if not job:
-            return
+def _compute(job_id: str, person_path: str, garment_path: str, out_path: str) -> None:
+    """
+    Pipeline de imagem (cv2/mediapipe) sem acesso ao banco: só lê os arquivos
+    de entrada e grava out_path. Status/DB ficam em process_tryon_job.
+    """
+    log_job(job_id, "Loading images")
+    person_bgr = _read_bgr(Path(person_path))
+
+    log_job(job_id, "Detecting torso anchor")
+    anchor = detect_torso_anchor_mediapipe(person_bgr)
+    if anchor is None:
+        raise ValueError("Pose anchor not detected. Use a clear photo with visible shoulders/torso.")
+
+    log_job(job_id, "Cutout garment (auto)")
+    garment_bgra = load_garment_cutout_bgra(garment_path)
 
-        job.status = "processing"
-        job.error_message = None
-        db.commit()
+    log_job(job_id, "Resize + composite")
+    garment_resized = resize_garment(garment_bgra, anchor.w, anchor.h)
+    out_bgr = overlay_bgra_on_bgr(
+        person_bgr, garment_resized, anchor.x, anchor.y, inplace=True, premultiplied=True
+    )
 
-        log_job(job_id, "Loading images")
-        person_bgr = _read_bgr(Path(job.person_image_path))
-        garment_bgr = _read_bgr(Path(job.garment_image_path))
+    ok = cv2.imwrite(out_path, out_bgr, PNG_ENCODE_PARAMS)
+    if not ok:
+        raise RuntimeError("Failed to write output image")
 
-        log_job(job_id, "Detecting torso anchor")
-        anchor = detect_torso_anchor_mediapipe(person_bgr)
-        if anchor is None:
-            raise ValueError("Pose anchor not detected. Use a clear photo with visible shoulders/torso.")
 
-        log_job(job_id, "Cutout garment (auto)")
-        garment_bgra = garment_cutout_auto_bgra(garment_bgr)
+def process_tryon_job(job_id: str) -> None:
+    # parse uma vez, antes de abrir Session: id inválido falha direto no RQ
+    # e o except abaixo reusa o mesmo UUID
+    jid = UUID(job_id)
+    db: Session = SessionLocal()
+    try:
+        row = db.execute(_STMT_JOB_PATHS, {"id": jid}).first()
+        if row is None:
+            return
+        out_path = RESULTS_DIR / f"{jid}.png"
 
-        log_job(job_id, "Resize + composite")
-        garment_resized = cv2.resize(garment_bgra, (anchor.w, anchor.h), interpolation=cv2.INTER_AREA)
-        out_bgr = overlay_bgra_on_bgr(person_bgr, garment_resized, anchor.x, anchor.y)
+        # UPDATE condicional (Core): se outro worker já pegou o job, sai
+        if not mark_processing(db, jid):
+            return
 
-        out_path = RESULTS_DIR / f"{job.id}.png"
-        ok = cv2.imwrite(str(out_path), out_bgr)
-        if not ok:
-            raise RuntimeError("Failed to write output image")
+        _compute(job_id, row.person_image_path, row.garment_image_path, str(out_path))
 
-        job.status = "done"
-        job.result_image_path = str(out_path)
-        job.error_message = None
-        db.commit()
+        mark_done(db, jid, str(out_path), mime_type="image/png")
 
         log_job(job_id, f"Done: {out_path.name}")
 
@@ -70,19 +87,12 @@ def process_tryon_job(job_id: str) -> None:
         tb = traceback.format_exc()
 
         try:
-            job = db.query(TryOnJob).filter(TryOnJob.id == UUID(job_id)).first()
-            if job:
-                job.status = "error"
-                job.error_message = err[:2000]
-                db.commit()
+            db.rollback()
+            mark_error(db, jid, "WORKER_ERROR", err)
         except Exception:
             pass
 
-        log_job(job_id, f"ERROR: {err}")
-        try:
-            (LOGS_DIR / f"{job_id}.log").open("a", encoding="utf-8").write(tb + "\n")
-        except Exception:
-            pass
+        log_job(job_id, f"ERROR: {err}", extra={"traceback": tb})
 
     finally:
         db.close()
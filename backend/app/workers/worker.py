@@ -2,36 +2,96 @@
 from __future__ import annotations
 
 import time
-import traceback
-from pathlib import Path
 from uuid import UUID
 
 import cv2
+from sqlalchemy.orm import Session
 
 from settings import RESULTS_DIR
 from app.core.logging import job_log
 from app.infra.db.crud import (
-    claim_next_job,
+    claim_next_jobs,
     fail_stuck_jobs,
     get_job,
     mark_done,
     mark_error,
     mark_processing,
 )
-from app.infra.db.database import SessionLocal
+from app.infra.db.database import SessionLocal, engine, worker_session
+from app.infra.queue.pg_notify import JobListener
 from app.ai.pose import detect_torso_anchor_mediapipe
-from app.ai.image_utils import garment_cutout_auto_bgra, overlay_bgra_on_bgr
+from app.ai.image_utils import (
+    PNG_ENCODE_PARAMS,
+    configure_worker_threads,
+    load_garment_cutout_bgra,
+    overlay_bgra_on_bgr,
+    resize_garment,
+)
+
+# RESULTS_DIR é criado no import do settings
+_RESULTS = str(RESULTS_DIR)
 
 
-def _read_bgr(path: str):
-    img = cv2.imread(path, cv2.IMREAD_COLOR)
+def _read_bgr(path: str, flags: int = cv2.IMREAD_COLOR):
+    img = cv2.imread(path, flags)
     if img is None:
         raise ValueError(f"Failed to read image: {path}")
     return img
 
 
-def _ensure_dir(path: Path) -> None:
-    path.mkdir(parents=True, exist_ok=True)
+def _run_job(db: Session, job_uuid: UUID, person_path: str, garment_path: str) -> bool:
+    """Pipeline de um job já em processing; grava done/error pela Session dada."""
+    job_id = str(job_uuid)
+    try:
+        job_log(job_id, "processing started")
+
+        person_bgr = _read_bgr(person_path)
+
+        anchor = detect_torso_anchor_mediapipe(person_bgr)
+        if anchor is None:
+            raise ValueError("POSE_NOT_FOUND")
+
+        garment_bgra = load_garment_cutout_bgra(garment_path)
+        garment_resized = resize_garment(garment_bgra, anchor.w, anchor.h)
+
+        out_bgr = overlay_bgra_on_bgr(
+            person_bgr, garment_resized, anchor.x, anchor.y, inplace=True, premultiplied=True
+        )
+
+        out_name = f"{job_uuid}.png"
+        out_path = f"{_RESULTS}/{out_name}"
+
+        ok = cv2.imwrite(out_path, out_bgr, PNG_ENCODE_PARAMS)
+        if not ok:
+            raise RuntimeError("WRITE_FAILED")
+
+        if not mark_done(db, job_uuid, out_path, mime_type="image/png"):
+            # já finalizado por fora (ex.: WORKER_TIMEOUT): mantém o status gravado
+            job_log(job_id, f"result discarded, job no longer processing -> {out_name}")
+            return False
+        job_log(job_id, f"done -> {out_name}")
+        return True
+
+    except Exception as e:
+        msg = str(e)
+
+        if msg == "POSE_NOT_FOUND":
+            code = "POSE_NOT_FOUND"
+            human = (
+                "Não foi possível detectar ombros/torso.\n"
+                "Use foto frontal com corpo visível."
+            )
+        elif msg == "WRITE_FAILED":
+            code = "WRITE_FAILED"
+            human = "Falha ao salvar imagem resultado."
+        else:
+            code = "WORKER_ERROR"
+            human = f"{type(e).__name__}: {e}"
+
+        db.rollback()
+        mark_error(db, job_uuid, code, human)
+        job_log(job_id, f"ERROR {code}: {human}", exc_info=True)
+        return False
 
 
 def process_one(job_id: str) -> bool:
@@ -48,88 +108,61 @@ def process_one(job_id: str) -> bool:
         if job.status not in ("queued", "processing"):
             return False
 
-        try:
-            # Só marca processing se ainda estiver queued
-            if job.status == "queued":
-                mark_processing(db, job)
-
-            job_log(job_id, "processing started")
-
-            person_bgr = _read_bgr(job.person_image_path)
-            garment_bgr = _read_bgr(job.garment_image_path)
-
-            anchor = detect_torso_anchor_mediapipe(person_bgr)
-            if anchor is None:
-                raise ValueError("POSE_NOT_FOUND")
-
-            garment_bgra = garment_cutout_auto_bgra(garment_bgr)
-            garment_resized = cv2.resize(
-                garment_bgra,
-                (anchor.w, anchor.h),
-                interpolation=cv2.INTER_AREA,
-            )
+        # Copia o que o pipeline usa: os mark_* fazem commit e o objeto expiraria
+        job_uuid = job.id
+        person_path = job.person_image_path
+        garment_path = job.garment_image_path
+        was_queued = job.status == "queued"
 
-            out_bgr = overlay_bgra_on_bgr(person_bgr, garment_resized, anchor.x, anchor.y)
-
-            _ensure_dir(RESULTS_DIR)
-            out_path = RESULTS_DIR / f"{job.id}.png"
-
-            ok = cv2.imwrite(str(out_path), out_bgr)
-            if not ok:
-                raise RuntimeError("WRITE_FAILED")
-
-            mark_done(db, job, str(out_path))
-            job_log(job_id, f"done -> {out_path.name}")
-            return True
-
-        except Exception as e:
-            msg = str(e)
-
-            if msg == "POSE_NOT_FOUND":
-                code = "POSE_NOT_FOUND"
-                human = (
-                    "Não foi possível detectar ombros/torso.\n"
-                    "Use foto frontal com corpo visível."
-                )
-            elif msg == "WRITE_FAILED":
-                code = "WRITE_FAILED"
-                human = "Falha ao salvar imagem resultado."
-            else:
-                code = "WORKER_ERROR"
-                human = f"{type(e).__name__}: {e}"
-
-            mark_error(db, job, code, human)
-            job_log(job_id, f"ERROR {code}: {human}")
-            job_log(job_id, traceback.format_exc())
+        # Só marca processing se ainda estiver queued
+        if was_queued and not mark_processing(db, job_uuid):
             return False
 
+        return _run_job(db, job_uuid, person_path, garment_path)
+
     finally:
         db.close()
 
 
-def loop(poll_seconds: float = 1.0) -> None:
+def loop(poll_seconds: float = 1.0, batch_size: int = 1) -> None:
     """
     Loop principal do worker:
     - finaliza jobs travados (stuck)
-    - claim atômico do próximo job queued (evita corrida entre workers)
-    - processa o job
+    - claim atômico de até batch_size jobs queued (evita corrida entre workers)
+    - processa os jobs em sequência
+      (o lote inteiro recebe o mesmo processing_started_at e fica preso a este
+      worker: batch_size > 1 só se batch_size x tempo por job couber no timeout
+      de stuck; para paralelismo, suba mais workers)
+    - sem job: espera um NOTIFY (Postgres) ou poll_seconds
     """
+    configure_worker_threads()
     print("Worker iniciado. Aguardando jobs queued... (CTRL+C para sair)")
 
-    while True:
-        db = SessionLocal()
-        try:
-            fail_stuck_jobs(db, timeout_seconds=240)
-
-            job = claim_next_job(db)
-            if not job:
-                time.sleep(poll_seconds)
-                continue
-
-            process_one(str(job.id))
-
-        finally:
-            db.close()
+    # Postgres: acorda por LISTEN/NOTIFY; poll_seconds vira só o timeout de segurança
+    listener = JobListener.open(engine)
+    try:
+        # Uma Session para a vida do worker: todas as escritas são Core e os jobs
+        # do claim vêm desanexados, então o identity map não cresce; a conexão
+        # volta ao pool a cada commit/rollback
+        with worker_session() as db:
+            while True:
+                fail_stuck_jobs(db, timeout_seconds=240)
+
+                jobs = claim_next_jobs(db, n=batch_size)
+                if not jobs:
+                    if listener is not None:
+                        listener.wait(poll_seconds)
+                    else:
+                        time.sleep(poll_seconds)
+                    continue
+
+                # o claim já trouxe os paths: sem novo SELECT/Session por job
+                for job in jobs:
+                    _run_job(db, job.id, job.person_image_path, job.garment_image_path)
+                db.expire_all()
+    finally:
+        if listener is not None:
+            listener.close()
 
 
 if __name__ == "__main__":
@@ -9,7 +9,6 @@ def main():
         row = ApiKey(name="local-dev", key=key, is_active=True, rpm_limit=60)
         db.add(row)
         db.commit()
-        db.refresh(row)
         print("API KEY criada:")
         print(row.key)
     finally:
@@ -0,0 +1,77 @@
+# backend/tests/test_redis_rate_limiter.py
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # EVAL/EVALSHA no fakeredis
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+# o código importa "settings"; o módulo do repo é setting.py
+sys.modules.setdefault("settings", importlib.import_module("setting"))
+
+from fastapi import HTTPException  # noqa: E402
+
+from app.security.redis_rate_limiter import KEY_PREFIX, WINDOW_SECONDS, RedisRateLimiter  # noqa: E402
+
+KEY = "k1"
+PROCESSES = 4
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def _limiters(server, n, **kwargs):
+    # um limiter por "processo", todos no mesmo Redis
+    return [RedisRateLimiter(fakeredis.FakeRedis(server=server), **kwargs) for _ in range(n)]
+
+
+def _admitted(limiters, rpm_limit, requests):
+    # 1ª request em cada processo, o resto todo no primeiro: o pior caso para
+    # tokens reservados e presos nos outros processos
+    ok = 0
+    for i in range(requests):
+        limiter = limiters[i] if i < len(limiters) else limiters[0]
+        try:
+            limiter.check(KEY, rpm_limit)
+            ok += 1
+        except HTTPException as e:
+            assert e.status_code == 429
+    return ok
+
+
+def _counter(server, now):
+    window = int(now) // WINDOW_SECONDS
+    return int(fakeredis.FakeRedis(server=server).get(f"{KEY_PREFIX}{KEY}:{window}") or 0)
+
+
+@pytest.fixture
+def fixed_time(monkeypatch):
+    now = 1_700_000_010.0
+    monkeypatch.setattr("app.security.redis_rate_limiter.time.time", lambda: now)
+    return now
+
+
+def test_default_batch_has_no_false_rejections_across_processes(server, fixed_time):
+    limiters = _limiters(server, PROCESSES)
+    assert _admitted(limiters, rpm_limit=20, requests=20) == 20
+    assert _admitted(limiters, rpm_limit=20, requests=PROCESSES) == 0
+
+
+def test_rejected_requests_do_not_inflate_counter(server, fixed_time):
+    limiters = _limiters(server, PROCESSES)
+    _admitted(limiters, rpm_limit=20, requests=50)
+    assert _counter(server, fixed_time) == 20
+
+
+def test_small_limits_do_not_borrow_in_batches(server, fixed_time):
+    # batch configurado alto, mas rpm_limit // 10 = 2: no máximo 1 token preso por processo
+    limiters = _limiters(server, PROCESSES, borrow_batch=5)
+    assert _admitted(limiters, rpm_limit=20, requests=20) >= 20 - PROCESSES
+    assert _counter(server, fixed_time) <= 20